@@ -0,0 +1,300 @@
+"""Paginated admin API over the students collection.
+
+Both the exam app and the admin server register the `admin_api` blueprint;
+it reads the storage backend from `app.config['STORAGE']`.
+
+    GET /admin/api/students        one page of students (list fields only)
+    GET /admin/api/students/<id>   one student with section scores and question details
+    GET /admin/export.csv          every matching student as CSV, streamed
+    GET /admin/export.xlsx         every matching student as an Excel workbook,
+                                   sent once complete (only the CSV streams)
+
+Pages are cursor based (see the backends' query_students), never
+offsets, so every page costs the same whatever its position. On Firestore,
+sorting and filtering by college/stream combined with a sort field needs a
+composite index; Firestore answers the first such query with a link that
+creates it.
+"""
+import csv
+import io
+import logging
+import tempfile
+from datetime import datetime
+
+from flask import Blueprint, Response, current_app, jsonify, request, send_file
+
+from question_bank import get_bank
+from score_stats import STATS_COLLECTION, STATS_DOCUMENT, normalize
+from scoring import question_results
+from storage import SORT_FIELDS, decode_cursor
+
+log = logging.getLogger(__name__)
+
+admin_api = Blueprint('admin_api', __name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+EXPORT_PAGE_SIZE = 500
+LIST_FIELDS = ['name', 'dob', 'puCollege', 'stream', 'mobile', 'address', 'exam_date',
+               'completion_time', 'total_score', 'normalized_score', 'total_questions']
+
+
+def page_args(args):
+    """Read paging, sorting and filter arguments from a request's query string."""
+    def number(name):
+        value = args.get(name)
+        if value in (None, ''):
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f'{name} must be a number')
+
+    sort = args.get('sort', 'exam_date')
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"sort must be one of {', '.join(SORT_FIELDS)}")
+    order = args.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        raise ValueError('order must be asc or desc')
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    cursor = args.get('cursor') or None
+    if cursor:
+        values = decode_cursor(cursor)  # A malformed cursor is a bad request
+        if len(values) != 2:  # Every sort orders by a field, then by document id
+            raise ValueError('Invalid cursor')
+    return {
+        'cursor': cursor,
+        'limit': max(1, min(limit, MAX_PAGE_SIZE)),
+        'sort': sort,
+        'order': order,
+        'college': args.get('college') or None,
+        'stream': args.get('stream') or None,
+        'min_score': number('min_score'),
+        'max_score': number('max_score'),
+    }
+
+
+def iter_students(storage, page_size=EXPORT_PAGE_SIZE, **kwargs):
+    """Yield (id, data) for every matching student, one page in memory at a time."""
+    kwargs.pop('cursor', None)
+    kwargs.pop('limit', None)
+    cursor = None
+    while True:
+        students, cursor = storage.query_students(cursor=cursor, limit=page_size, **kwargs)
+        yield from students
+        if not cursor:
+            return
+
+
+def student_summary(student_id, data):
+    """The fields shown for a student in dashboard lists."""
+    return {
+        'id': student_id,
+        'name': data.get('name', 'Unknown'),
+        'dob': data.get('dob', ''),
+        'address': data.get('address', ''),
+        'pu_college': data.get('puCollege', ''),
+        'stream': data.get('stream', ''),
+        'phone': data.get('mobile', ''),
+        'exam_date': data.get('exam_date', ''),
+        'completion_time': data.get('completion_time', ''),
+        'raw_score': data.get('total_score', 0),
+        'total_score': data.get('normalized_score', 0),
+        'total_questions': data.get('total_questions', 0)
+    }
+
+
+def section_breakdown(scores):
+    """Per-section raw and normalized scores from a student's `scores` map."""
+    section_scores = {}
+    for section, section_data in (scores or {}).items():
+        if isinstance(section_data, dict):
+            section_total = section_data.get('total_questions', 0)
+            section_score = section_data.get('marks', 0)
+            if isinstance(section_score, (int, float)):
+                section_scores[section] = {
+                    'raw_score': section_score,
+                    'total': section_total,
+                    'normalized_score': normalize(section_score, section_total)
+                }
+    return section_scores
+
+
+def question_details(bank, scores):
+    """Per-question results of each section, as shown when a student is expanded."""
+    details = {}
+    for section, section_data in (scores or {}).items():
+        if isinstance(section_data, dict) and ('answers' in section_data or 'debug' in section_data):
+            details[section] = {
+                'questions': [
+                    {
+                        'question': q.get('question', ''),
+                        'student_answer': q.get('student', ''),
+                        'correct_answer': q.get('correct', ''),
+                        'is_correct': q.get('match', False)
+                    }
+                    for q in question_results(bank, section, section_data)
+                ],
+                'total': section_data.get('total_questions', 0)
+            }
+    return details
+
+
+EXPORT_COLUMNS = ['Name', 'College', 'Stream', 'Phone', 'Address', 'Exam Date',
+                  'Completion Time', 'Total Score']
+EXPORT_COLUMN_WIDTHS = [25, 30, 15, 15, 40, 15, 15, 15]
+
+
+def export_rows(storage, sections, **kwargs):
+    """Yield the export's header row followed by one row per student.
+
+    Section columns are fixed up front from the dashboard statistics, so rows
+    can be written out as soon as each page arrives.
+    """
+    yield EXPORT_COLUMNS + [f'{section} Score' for section in sections]
+    for student_id, data in iter_students(storage, fields=LIST_FIELDS + ['scores'], **kwargs):
+        student = student_summary(student_id, data)
+        section_scores = section_breakdown(data.get('scores'))
+        row = [
+            student['name'] or 'Unknown',
+            student['pu_college'] or 'Not provided',
+            student['stream'] or 'Not specified',
+            student['phone'] or 'Not provided',
+            student['address'] or 'Not provided',
+            student['exam_date'] or 'Not provided',
+            student['completion_time'] or 'Not provided',
+            f"{student['total_score']}/100"
+        ]
+        for section in sections:
+            score = section_scores.get(section)
+            row.append(f"{score['raw_score']}/{score['total']} ({score['normalized_score']}%)" if score else '')
+        yield row
+
+
+def export_filename(extension):
+    return f"student_results_{datetime.now().strftime('%Y-%m-%dT%H-%M-%S')}.{extension}"
+
+
+def _export_args():
+    storage = current_app.config['STORAGE']
+    kwargs = page_args(request.args)
+    # One column per section of the question bank, in sheet order, so sections
+    # nobody has submitted yet are still exported. Without a bank (an admin
+    # server with no workbook beside it) fall back to the sections the
+    # statistics summary has seen; an export never rebuilds it
+    sections = list(get_bank().sections)
+    if not sections:
+        summary = storage.get(STATS_COLLECTION, STATS_DOCUMENT) or {}
+        sections = sorted(summary.get('sections', {}))
+    if not sections:
+        log.warning('Exporting without section columns: no question bank or statistics summary')
+    return storage, sections, kwargs
+
+
+@admin_api.route('/admin/export.csv')
+def export_csv():
+    try:
+        storage, sections, kwargs = _export_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        # Each page of students becomes one chunk of the response
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        try:
+            for i, row in enumerate(export_rows(storage, sections, **kwargs)):
+                writer.writerow(row)
+                if i % EXPORT_PAGE_SIZE == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate(0)
+        except Exception:
+            # Headers are already sent; all that is left is to cut the file short
+            log.exception('Error exporting students')
+        yield buffer.getvalue()
+
+    return Response(generate(), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename={export_filename("csv")}'
+    })
+
+
+@admin_api.route('/admin/export.xlsx')
+def export_xlsx():
+    """The export as an Excel workbook.
+
+    Unlike the CSV export this is not streamed: nothing is sent until every
+    row has been written, because the zip container is only complete then.
+    Use the CSV export for very large cohorts.
+    """
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    try:
+        storage, sections, kwargs = _export_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Write-only mode spools rows to disk as they are appended, so memory stays flat
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Student Results')
+    widths = EXPORT_COLUMN_WIDTHS + [20] * len(sections)
+    for i, width in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+    try:
+        for row in export_rows(storage, sections, **kwargs):
+            ws.append(row)
+    except Exception as e:
+        log.exception('Error exporting students')
+        return jsonify({'error': str(e)}), 500
+
+    output = tempfile.TemporaryFile()
+    wb.save(output)
+    output.seek(0)
+    return send_file(output, as_attachment=True, download_name=export_filename('xlsx'),
+                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+
+@admin_api.route('/admin/api/students')
+def list_students():
+    try:
+        kwargs = page_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    include_sections = request.args.get('include') == 'sections'
+    fields = LIST_FIELDS + ['scores'] if include_sections else LIST_FIELDS
+    try:
+        students, next_cursor = current_app.config['STORAGE'].query_students(fields=fields, **kwargs)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log.exception('Error listing students')
+        return jsonify({'error': str(e)}), 500
+
+    results = []
+    for student_id, data in students:
+        summary = student_summary(student_id, data)
+        if include_sections:
+            summary['section_scores'] = section_breakdown(data.get('scores'))
+        results.append(summary)
+    return jsonify({'students': results, 'next_cursor': next_cursor})
+
+
+@admin_api.route('/admin/api/students/<student_id>')
+def get_student(student_id):
+    try:
+        data = current_app.config['STORAGE'].get('students', student_id)
+    except Exception as e:
+        log.exception('Error reading student', extra={'student_id': student_id})
+        return jsonify({'error': str(e)}), 500
+    if data is None:
+        return jsonify({'error': 'Student not found'}), 404
+
+    student = student_summary(student_id, data)
+    student['section_scores'] = section_breakdown(data.get('scores'))
+    # Question text and correct answers come from the current question bank
+    student['question_details'] = question_details(get_bank(), data.get('scores'))
+    return jsonify(student)
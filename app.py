@@ -1,18 +1,33 @@
 from flask import Flask, render_template, jsonify, session, redirect, url_for, send_from_directory, request
-import pandas as pd
 import os
 from datetime import datetime
-import firebase_admin
-from firebase_admin import credentials, firestore
 import json
+import logging
+import metrics
+from admin_results import admin_api, page_args
+from autosave import AutosaveBuffer
+from logs import DroppingQueueHandler, setup_logging
+from question_bank import get_bank
+from question_order import ordered_questions, student_order
+from question_payload import cached_payload, payload_response, question_rows
+from score_stats import increment_ops, load_stats, login_increment, student_totals, submit_increment
+from scoring import get_engine, section_scores
+from storage import get_storage
+from write_queue import MAX_BATCH_WRITES, WriteBehindQueue
+
+setup_logging()
+log = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'  # Required for session
 
-# Initialize Firebase
-cred = credentials.Certificate('serviceAccountKey.json')
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+app.register_blueprint(admin_api)
+metrics.init_app(app)
+
+# Per-process state, set up by start_worker() at the end of this module
+storage = None
+write_queue = None
+autosave_buffer = None
 
 # Add route to serve static files
 @app.route('/static/<path:filename>')
@@ -26,129 +41,28 @@ def index():
 @app.route('/admin')
 def admin_dashboard():
     try:
-        print("\n=== Starting admin_dashboard route ===")
-        
-        # Get all student records
-        students_ref = db.collection('students')
-        students = students_ref.get()
-        print(f"Connected to Firebase successfully")
-        
         # Get total questions from Excel
         excel_data = read_excel_data()
         total_questions_from_excel = excel_data['total_questions']
-        print(f"Total questions from Excel: {total_questions_from_excel}")
         
-        students_data = []
-        total_students = 0
-        highest_score = 0
-        total_score_sum = 0
-        
-        print("\n=== Processing all students ===")
-        for student in students:
-            data = student.to_dict()
-            student_id = student.id
-            print(f"\n--- Student ID: {student_id} ---")
-            
-            # Get scores and section data from Firebase
-            scores = data.get('scores', {})
-            
-            section_scores = {}
-            total_score = 0
-            question_details = {}
-            section_totals = {}
-            
-            # Process each section's scores and questions
-            for section, section_data in scores.items():
-                if isinstance(section_data, dict):
-                    # Get section total questions and marks
-                    section_total = section_data.get('total_questions', 0)
-                    section_score = section_data.get('marks', 0)
-                    section_totals[section] = section_total
-                    
-                    if isinstance(section_score, (int, float)):
-                        # Calculate normalized section score (out of 100)
-                        normalized_section_score = round((section_score / section_total * 100) if section_total > 0 else 0)
-                        section_scores[section] = {
-                            'raw_score': section_score,
-                            'total': section_total,
-                            'normalized_score': normalized_section_score
-                        }
-                        total_score += section_score
-                        
-                        # Process question details
-                        if 'debug' in section_data:
-                            questions = []
-                            for q in section_data['debug']:
-                                question_info = {
-                                    'question': q.get('question', ''),
-                                    'student_answer': q.get('student', ''),
-                                    'correct_answer': q.get('correct', ''),
-                                    'is_correct': q.get('match', False)
-                                }
-                                questions.append(question_info)
-                            question_details[section] = {
-                                'questions': questions,
-                                'total': section_total
-                            }
-            
-            # Use total questions from Excel if available, otherwise sum from sections
-            total_questions = total_questions_from_excel if total_questions_from_excel > 0 else sum(section_totals.values())
-            
-            # Calculate normalized total score (out of 100)
-            normalized_total_score = round((total_score / total_questions * 100) if total_questions > 0 else 0)
-            
-            # Update statistics
-            total_students += 1
-            highest_score = max(highest_score, normalized_total_score)
-            total_score_sum += normalized_total_score
-            
-            # Format student data for template
-            formatted_student = {
-                'name': data.get('name', 'Unknown'),
-                'dob': data.get('dob', ''),
-                'address': data.get('address', ''),
-                'pu_college': data.get('puCollege', ''),
-                'stream': data.get('stream', ''),
-                'phone': data.get('mobile', ''),
-                'exam_date': data.get('exam_date', ''),
-                'completion_time': data.get('completion_time', ''),
-                'raw_score': total_score,
-                'total_score': normalized_total_score,
-                'section_scores': section_scores,
-                'question_details': question_details,
-                'total_questions': total_questions
-            }
-            
-            students_data.append(formatted_student)
-            print(f"\nProcessed student: {formatted_student['name']} with {len(question_details)} sections")
-            print(f"Raw score: {total_score}/{total_questions}")
-            print(f"Normalized score: {normalized_total_score}/100")
-            
-            # Print section-wise scores for debugging
-            for section, score_data in section_scores.items():
-                print(f"{section}: {score_data['raw_score']}/{score_data['total']} (Normalized: {score_data['normalized_score']}/100)")
-        
-        # Calculate average score
-        average_score = round(total_score_sum / total_students) if total_students > 0 else 0
+        # Statistics come from the incrementally maintained summary document;
+        # the student lists are fetched page by page from /admin/api/students
+        stats = load_stats(storage, total_questions_from_excel)
         
         template_data = {
-            'students': students_data,
             'stats': {
-                'total_students': total_students,
-                'highest_score': highest_score,
-                'average_score': average_score,
+                'total_students': stats['total_students'],
+                'highest_score': stats['highest_score'],
+                'average_score': stats['average_score'],
                 'total_questions': total_questions_from_excel  # Add total questions to stats
             }
         }
         
         return render_template('index.html', data=template_data)
         
-    except Exception as e:
-        print(f"\n!!! Error in admin_dashboard !!!")
-        print(f"Error type: {type(e).__name__}")
-        print(f"Error message: {str(e)}")
-        print(f"Full error details: {e}")
-        return render_template('index.html', data={'students': [], 'stats': {'total_students': 0, 'highest_score': 0, 'average_score': 0, 'total_questions': 0}})
+    except Exception:
+        log.exception('Error in admin_dashboard')
+        return render_template('index.html', data={'stats': {'total_students': 0, 'highest_score': 0, 'average_score': 0, 'total_questions': 0}})
 
 @app.route('/login')
 def login():
@@ -169,12 +83,16 @@ def submit_login():
         # Calculate total sum of all questions
         total_sum = sum(sections.values())
         
-        # Initialize scores structure with correct total questions from Excel
+        # Initialize scores structure with correct total questions from Excel;
+        # the marks are kept apart, see below
         initial_scores = {}
+        initial_marks = {}
         for section_name, total_questions in sections.items():
             initial_scores[section_name] = {
+                'total_questions': total_questions  # Use the actual count from Excel
+            }
+            initial_marks[section_name] = {
                 'correct_answers': 0,
-                'total_questions': total_questions,  # Use the actual count from Excel
                 'marks': 0
             }
 
@@ -190,154 +108,69 @@ def submit_login():
             'total_questions': total_sum  # Add total sum of all questions
         }
         
-        # Store in Firebase
-        student_ref = db.collection('students').document()
-        student_id = student_ref.id
-        student_ref.set(student_data)
+        # Queue the write to storage; the document id is generated locally.
+        # Under gunicorn a submission queued by another worker may reach
+        # storage first: the profile is merged, and the score fields are
+        # incremented by 0, which creates them as 0 (so score-sorted lists
+        # include everyone) but leaves a submitted score as it is
+        student_id = storage.new_id('students')
+        write_queue.enqueue([
+            ('merge', 'students', student_id, student_data),
+            ('increment', 'students', student_id, {
+                'scores': initial_marks,
+                'total_score': 0,
+                'normalized_score': 0
+            }),
+            *increment_ops(login_increment())
+        ])
         
         # Store student_id in session
         session['student_id'] = student_id
+        session.pop('submitted_scores', None)
         
         # Redirect to exam page
         return redirect(url_for('exam'))
-    except Exception as e:
-        print(f"Error in submit_login: {str(e)}")
+    except Exception:
+        log.exception('Error in submit_login')
         # If there's an error, still redirect to exam
         # The client-side has already saved data in sessionStorage
         return redirect(url_for('exam'))
 
-def truncate_text(text, max_length=50):
-    if pd.isna(text) or not isinstance(text, str):
-        return ''
-    return (text[:max_length] + '...') if len(text) > max_length else text
-
-def load_questions():
-    questions = {}
-    if os.path.exists('exam_questions.xlsx'):
-        excel_file = pd.ExcelFile('exam_questions.xlsx')
-        for sheet_name in excel_file.sheet_names:
-            df = pd.read_excel(excel_file, sheet_name=sheet_name)
-            # Remove any empty rows
-            df = df.dropna(how='all')
-            # Only truncate options, not questions
-            if not df.empty:
-                for col in ['Option A', 'Option B', 'Option C', 'Option D']:
-                    if col in df.columns:
-                        df[col] = df[col].apply(lambda x: truncate_text(x, 100))
-                
-                # Reset the index before shuffling to capture original order
-                df = df.reset_index(drop=True)
-                df['original_id'] = df.index.astype(str)  # use the original row index as a stable id
-                
-                # Shuffle the dataframe rows
-                df = df.sample(frac=1).reset_index(drop=True)
-                
-                # Add question numbers after shuffling for display purposes
-                questions_list = df.fillna('').to_dict('records')
-                for i, q in enumerate(questions_list, 1):
-                    q['question_number'] = i
-                
-                questions[sheet_name] = questions_list
-    return questions
+def load_questions(student_id=''):
+    # The student's own question order; the cached bank itself stays in sheet order
+    return ordered_questions(get_bank(), student_id)
 
 def read_excel_data():
-    try:
-        if not os.path.exists('exam_questions.xlsx'):
-            print("Excel file not found")
-            return {
-                'sections': {},
-                'duration': None,
-                'total_questions': 0
-            }
-            
-        # Read the Excel file
-        xls = pd.ExcelFile('exam_questions.xlsx')
-        sections = {}
-        duration = None
-        total_questions = 0
-        
-        # First try to get total questions from TotalQuestions sheet
-        if 'TotalQuestions' in xls.sheet_names:
-            try:
-                total_df = pd.read_excel(xls, sheet_name='TotalQuestions')
-                if 'Total' in total_df.columns:
-                    total_questions = int(total_df['Total'].iloc[0])
-                    print(f"Found total questions: {total_questions} from TotalQuestions sheet")
-            except Exception as e:
-                print(f"Error reading TotalQuestions sheet: {str(e)}")
-        
-        # Process each sheet
-        for sheet_name in xls.sheet_names:
-            if sheet_name == 'TotalQuestions':  # Skip the TotalQuestions sheet
-                continue
-                
-            df = pd.read_excel(xls, sheet_name=sheet_name)
-            print(f"Reading sheet: {sheet_name}")
-            
-            # Clean column names - strip whitespace and handle case
-            df.columns = [str(col).strip() for col in df.columns]
-            print(f"Columns found: {list(df.columns)}")
-            
-            # Count questions in this sheet - only if Question column exists
-            if 'Question' in df.columns:
-                valid_rows = df[df['Question'].notna()]
-                question_count = len(valid_rows)
-                
-                if question_count > 0:
-                    sections[sheet_name] = question_count
-                    print(f"Found {question_count} questions in {sheet_name}")
-                    
-                    # Look for duration in any column
-                    for col in df.columns:
-                        if col == 'Duration':  # Exact match only
-                            try:
-                                # Look for numeric values in this column
-                                duration_values = df[col].apply(lambda x: pd.to_numeric(x, errors='coerce')).dropna()
-                                if not duration_values.empty:
-                                    first_value = duration_values.iloc[0]
-                                    if pd.notnull(first_value) and 0 < first_value <= 180:
-                                        duration = int(first_value)
-                                        print(f"Found duration: {duration} in column {col}")
-                                        break
-                            except Exception as e:
-                                print(f"Error reading duration from column {col}: {str(e)}")
-                                continue
-        
-        print(f"Final duration: {duration}")
-        print(f"Final sections: {sections}")
-        print(f"Total questions: {total_questions}")
-        
-        return {
-            'sections': sections,
-            'duration': duration,
-            'total_questions': total_questions
-        }
-    except Exception as e:
-        print(f"Error reading Excel file: {str(e)}")
-        return {
-            'sections': {},
-            'duration': None,
-            'total_questions': 0
-        }
+    bank = get_bank()
+    return {
+        'sections': bank.sections,
+        'duration': bank.duration,
+        'total_questions': bank.total_questions
+    }
 
 @app.route('/exam')
 def exam():
     current_date = datetime.now().strftime("%B %d, %Y")
-    questions = load_questions()
-    if not questions:
-        questions = {}
-    
+    # Questions are fetched by the page itself from /api/questions
     excel_data = read_excel_data()
     
     return render_template('index.html', 
-                         questions=questions,
                          current_date=current_date,
                          duration=excel_data['duration'])
 
+def questions_payload(bank):
+    # Questions and options of the whole bank in sheet order, without answers;
+    # serialized and compressed once per bank version
+    return cached_payload(bank.version, lambda: question_rows(bank))
+
 @app.route('/api/questions')
 def get_questions():
-    questions = load_questions()
-    return jsonify(questions)
+    return payload_response(questions_payload(get_bank()), request)
+
+@app.route('/api/questions/order')
+def get_question_order():
+    # The student's own question order, applied to the bank by the exam page
+    return jsonify(student_order(get_bank(), session.get('student_id', '')))
 
 @app.route('/submit-exam', methods=['POST'])
 def submit_exam():
@@ -352,79 +185,91 @@ def submit_exam():
         answers = data.get('answers', {})
         completion_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        # Get the questions for scoring and section counts from Excel
-        questions = load_questions()
-        excel_data = read_excel_data()
-        section_counts = excel_data['sections']
+        # Get the questions for scoring and section counts from the question bank
+        bank = get_bank()
+        section_counts = bank.sections
         
         # Calculate total sum of all questions
         total_sum = sum(section_counts.values())
         
         # Initialize scores structure
         scores = {}
-        question_details = {}
 
-        # Process each section
-        for section_name, section_answers in answers.items():
-            section_questions = questions.get(section_name, [])
-            
-            # Get total questions from Excel data
-            total_questions = section_counts.get(section_name, 0)
-            
-            # Initialize section scores with correct total from Excel
-            scores[section_name] = {
-                'correct_answers': 0,
-                'total_questions': total_questions,  # Use the count from Excel
-                'marks': 0,
-                'debug': []
-            }
+        # Score every section against the precompiled answer keys
+        engine = get_engine(bank)
+        with metrics.timed('scoring'):
+            for section_name, section_answers in answers.items():
+                correct_count, mask = engine.score_section(section_name, section_answers)
+                scores[section_name] = section_scores(bank, section_name, section_answers, correct_count, mask)
 
-            # Process each question in the section
-            for q in section_questions:
-                q_num = str(q.get('original_id', ''))
-                student_answer = section_answers.get(q_num)
-                correct_answer = q.get('Correct Answer')
-                
-                # Create debug entry
-                debug_entry = {
-                    'q_num': q_num,
-                    'question': q.get('Question', ''),
-                    'correct': correct_answer,
-                    'student': student_answer,
-                    'match': False
-                }
-
-                # Check if answer is correct
-                if student_answer and correct_answer and student_answer.upper() == correct_answer.upper():
-                    scores[section_name]['correct_answers'] += 1
-                    scores[section_name]['marks'] += 1
-                    debug_entry['match'] = True
-
-                scores[section_name]['debug'].append(debug_entry)
-
-        # Update student document in Firebase
-        student_ref = db.collection('students').document(student_id)
-        student_ref.update({
+        raw_score, _, normalized_score, section_normalized = student_totals(scores, bank.total_questions)
+
+        # Queue the update of the student document. A merge, not an update: under
+        # gunicorn the login write may sit in another worker's queue and reach
+        # storage later, and an update of a missing document would be dead-lettered
+        ops = [('merge', 'students', student_id, {
             'completion_time': completion_time,
+            # Answers are kept per section as an answer string in `scores`, which is
+            # what re-scoring reads; a raw map from an earlier submission is cleared
+            'answers': None,
             'scores': scores,
-            'question_details': question_details,
-            'total_questions': total_sum  # Add total sum of all questions
-        })
+            'total_questions': total_sum,  # Add total sum of all questions
+            'total_score': raw_score,
+            'normalized_score': normalized_score
+        })]
+        # A resubmission moves the student from their previous scores in the
+        # dashboard statistics rather than counting them again
+        ops += increment_ops(submit_increment(raw_score, normalized_score, section_normalized,
+                                              previous=session.get('submitted_scores')))
+        autosave_buffer.discard(student_id)
+        write_queue.enqueue(ops)
+        session['submitted_scores'] = [raw_score, normalized_score, section_normalized]
+        log.debug('Exam submitted', extra={'student_id': student_id, 'raw_score': raw_score,
+                                           'normalized_score': normalized_score})
 
         return jsonify({'success': True})
-    except Exception as e:
-        print(f"Error submitting exam: {str(e)}")
+    except Exception:
+        log.exception('Error submitting exam', extra={'student_id': session.get('student_id')})
         return jsonify({'error': 'Failed to submit exam'}), 500
 
+def write_autosaves(entries):
+    # Autosaves live in a collection of their own: one still buffered in another
+    # worker, or posted after the submission, can then never overwrite a submitted
+    # student document
+    ops = [('merge', 'autosaves', student_id, entry) for student_id, entry in entries]
+    for start in range(0, len(ops), MAX_BATCH_WRITES):
+        write_queue.enqueue(ops[start:start + MAX_BATCH_WRITES])
+
+@app.route('/save-answers', methods=['POST'])
+def save_answers():
+    student_id = session.get('student_id')
+    if not student_id:
+        return jsonify({'error': 'No student session found'}), 400
+
+    data = request.get_json(silent=True) or {}
+    changes = data.get('changes')
+    seq = data.get('seq')
+    if not isinstance(changes, dict) or not isinstance(seq, int):
+        return jsonify({'error': 'Expected changes and seq'}), 400
+    # Changes map each section to {question: answer or None}
+    for section_changes in changes.values():
+        if not isinstance(section_changes, dict) or not all(
+                isinstance(answer, str) or answer is None for answer in section_changes.values()):
+            return jsonify({'error': 'Expected changes to map sections to answers'}), 400
+
+    saved_seq = autosave_buffer.save(student_id, seq, changes,
+                                     time_remaining=data.get('timeRemaining'),
+                                     current_section=data.get('currentSection'))
+    return jsonify({'success': True, 'seq': saved_seq})
+
 @app.route('/admin/results')
 def view_results():
     try:
-        # Get all student records
-        students = db.collection('students').stream()
+        # One page of student records; the next page is named in X-Next-Cursor
+        students, next_cursor = storage.query_students(fields=None, **page_args(request.args))
         results = []
         
-        for student in students:
-            data = student.to_dict()
+        for student_id, data in students:
             results.append({
                 'name': data.get('name'),
                 'puCollege': data.get('puCollege'),
@@ -432,7 +277,12 @@ def view_results():
                 'scores': data.get('scores', {})
             })
             
-        return jsonify(results)
+        response = jsonify(results)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -495,5 +345,51 @@ def debug_test_scoring():
     
     return jsonify(debug_info)
 
+def warm_caches():
+    """Load everything that is shared, read-only, by all requests.
+
+    Under the pre-fork server this runs once in the master, so the workers
+    share these pages instead of each building their own copy.
+    """
+    bank = get_bank()  # Compiled bank file if present
+    get_engine(bank)
+    questions_payload(bank)
+
+def start_worker(journal_path='write_journal.log'):
+    """Connect to storage and start this process's background writers.
+
+    Neither database connections nor threads survive a fork, so under the
+    pre-fork server this runs in each worker after it is forked, with a
+    journal of its own (see gunicorn.conf.py).
+    """
+    global storage, write_queue, autosave_buffer
+    setup_logging()
+    # Firebase, or a local SQLite database when EXAM_STORAGE=sqlite
+    storage = metrics.TimedStorage(get_storage())
+    app.config['STORAGE'] = storage
+
+    # Student writes are journaled locally and committed to storage in the background
+    write_queue = WriteBehindQueue(storage.commit, journal_path,
+                                   permanent_errors=storage.permanent_errors,
+                                   applied_errors=storage.applied_errors)
+    write_queue.start()
+    autosave_buffer = AutosaveBuffer(write_autosaves)
+    autosave_buffer.start()
+    metrics.gauge('exam_write_queue_pending', 'Writes waiting to be committed to storage.',
+                  write_queue.pending_count)
+    metrics.gauge('exam_autosave_pending', 'Students with buffered autosaves.',
+                  autosave_buffer.pending_count)
+    metrics.gauge('exam_log_dropped', 'Log records dropped because the log queue was full.',
+                  lambda: DroppingQueueHandler.dropped)
+
+def stop_worker():
+    """Hand buffered autosaves to the write queue, then commit what can be committed."""
+    autosave_buffer.stop()
+    write_queue.stop()
+
+warm_caches()
+if not os.environ.get('EXAM_PREFORK'):
+    start_worker()
+
 if __name__ == '__main__':
     app.run(port=5000) 
\ No newline at end of file
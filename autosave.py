@@ -0,0 +1,93 @@
+import atexit
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class AutosaveBuffer:
+    """In-memory buffer for exam autosaves, flushed to storage in the background.
+
+    Each autosave carries only the answers changed since the candidate's last
+    save plus an increasing sequence number. Saves are merged per student
+    while they wait, so however many arrive between two flushes, each
+    student costs one write per flush.
+    """
+
+    def __init__(self, flush_fn, interval=2.0):
+        self.flush_fn = flush_fn      # called with a list of (student_id, autosave dict)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._seqs = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def save(self, student_id, seq, changes, time_remaining=None, current_section=None):
+        """Buffer one autosave; returns the latest sequence number accepted for the student.
+
+        Saves that arrive out of order (seq not above the last accepted one)
+        are ignored, since their changes are already covered by a newer save.
+        """
+        with self._lock:
+            last_seq = self._seqs.get(student_id, -1)
+            if seq <= last_seq:
+                return last_seq
+            self._seqs[student_id] = seq
+
+            entry = self._pending.setdefault(student_id, {'answers': {}})
+            for section, section_changes in changes.items():
+                entry['answers'].setdefault(section, {}).update(section_changes)
+            entry['seq'] = seq
+            entry['time_remaining'] = time_remaining
+            entry['current_section'] = current_section
+            entry['saved_at'] = time.strftime("%Y-%m-%d %H:%M:%S")
+            return seq
+
+    def discard(self, student_id):
+        """Drop a student's buffered autosave, e.g. once the exam is submitted."""
+        with self._lock:
+            self._pending.pop(student_id, None)
+
+    def pending_count(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Write out everything buffered so far."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            self.flush_fn(list(pending.items()))
+        except Exception:
+            log.exception('Error flushing autosaves', extra={'students': len(pending)})
+            # Put the entries back underneath anything saved since
+            with self._lock:
+                for student_id, entry in pending.items():
+                    newer = self._pending.get(student_id)
+                    if newer is not None:
+                        for section, section_changes in newer['answers'].items():
+                            entry['answers'].setdefault(section, {}).update(section_changes)
+                        newer['answers'] = entry['answers']
+                    else:
+                        self._pending[student_id] = entry
+            return 0
+        return len(pending)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='autosave-flusher', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 2)
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
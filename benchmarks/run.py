@@ -0,0 +1,222 @@
+"""Micro-benchmarks for the hot paths of the exam app.
+
+    python benchmarks/run.py [--filter scoring] [--save] [--check]
+
+Every benchmark runs against generated data: question workbooks of 50, 500
+and 5000 questions and student sets of 100 and 10k submissions. Each one is
+timed with timeit (best of --repeat runs) and reported per call.
+
+Results of a --save run are appended to benchmarks/history.jsonl together
+with the commit and the machine they were measured on. Every run is compared
+with the median of the last --window saved runs from the same machine, and
+anything more than --threshold slower is reported as a regression; with
+--check the script then exits with status 1, so it can gate a release.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from loadtest import synthetic_bank  # noqa: E402
+from question_bank import parse_workbook, truncate_text  # noqa: E402
+from question_order import ordered_questions  # noqa: E402
+from question_payload import encode_payload, question_rows  # noqa: E402
+from score_stats import build_summary, summarize  # noqa: E402
+from scoring import get_engine, section_scores  # noqa: E402
+
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.jsonl')
+QUESTION_COUNTS = [50, 500, 5000]
+STUDENT_COUNTS = [100, 10000]
+SECTIONS = 5
+
+BENCHMARKS = []
+
+
+def benchmark(name, params):
+    """Register a benchmark; the decorated setup(param) returns the callable to time."""
+    def register(setup):
+        for param in params:
+            BENCHMARKS.append((f'{name}[{param}]', setup, param))
+        return setup
+    return register
+
+
+_workdir = tempfile.mkdtemp(prefix='exam-bench-')
+_banks = {}
+
+
+def workbook(questions):
+    path = os.path.join(_workdir, f'bank_{questions}.xlsx')
+    if not os.path.exists(path):
+        synthetic_bank(path, sections=SECTIONS, questions=questions // SECTIONS)
+    return path
+
+
+def bank(questions):
+    if questions not in _banks:
+        _banks[questions] = parse_workbook(workbook(questions))
+    return _banks[questions]
+
+
+def submissions(bank, count, seed=0):
+    """Random answers to about three quarters of the questions, for `count` students."""
+    rng = random.Random(seed)
+    return [
+        {
+            section: {str(i): rng.choice('ABCD') for i in range(len(records)) if rng.random() < 0.75}
+            for section, records in bank.questions.items()
+        }
+        for _ in range(count)
+    ]
+
+
+@benchmark('parse_workbook', QUESTION_COUNTS)
+def bench_parse_workbook(questions):
+    path = workbook(questions)
+    return lambda: parse_workbook(path, version='bench')
+
+
+@benchmark('truncate_text', QUESTION_COUNTS)
+def bench_truncate_text(questions):
+    options = [q[col] * 3 for records in bank(questions).questions.values()
+               for q in records for col in ('Option A', 'Option B', 'Option C', 'Option D')]
+    return lambda: [truncate_text(text, 100) for text in options]
+
+
+@benchmark('ordered_questions', QUESTION_COUNTS)
+def bench_ordered_questions(questions):
+    b = bank(questions)
+    students = iter(range(10 ** 9))
+    return lambda: ordered_questions(b, f'student-{next(students)}')
+
+
+@benchmark('question_payload', QUESTION_COUNTS)
+def bench_question_payload(questions):
+    b = bank(questions)
+    return lambda: encode_payload(question_rows(b))
+
+
+@benchmark('score_submission', QUESTION_COUNTS)
+def bench_score_submission(questions):
+    # What /submit-exam does for one candidate
+    b = bank(questions)
+    engine = get_engine(b)
+    answers = submissions(b, 1)[0]
+
+    def score():
+        return {section: section_scores(b, section, section_answers, *engine.score_section(section, section_answers))
+                for section, section_answers in answers.items()}
+    return score
+
+
+@benchmark('score_batch', STUDENT_COUNTS)
+def bench_score_batch(students):
+    # What rescore.py does for a cohort, on a 500 question bank
+    b = bank(500)
+    engine = get_engine(b)
+    cohort = submissions(b, students)
+
+    def score():
+        for section in b.questions:
+            engine.score_batch(section, engine.encode_batch(section, [s[section] for s in cohort]))
+    return score
+
+
+@benchmark('dashboard_summary', STUDENT_COUNTS)
+def bench_dashboard_summary(students):
+    # Rebuilding the dashboard statistics from every student document
+    b = bank(500)
+    engine = get_engine(b)
+    docs = []
+    for answers in submissions(b, students):
+        scores = {section: section_scores(b, section, section_answers, *engine.score_section(section, section_answers))
+                  for section, section_answers in answers.items()}
+        docs.append({'completion_time': '2025-01-01 10:00:00', 'scores': scores})
+    return lambda: summarize(build_summary(docs, b.total_questions))
+
+
+def measure(fn, repeat):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def machine():
+    return {'node': platform.node(), 'python': platform.python_version(), 'cpus': os.cpu_count()}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path, node):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    return [run for run in runs if run['machine']['node'] == node]
+
+
+def baseline(history, name, window):
+    values = [run['results'][name] for run in history[-window:] if name in run['results']]
+    return statistics.median(values) if values else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the exam app micro-benchmarks')
+    parser.add_argument('--filter', help='only run benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', action='store_true', help=f'append the results to {HISTORY_FILE}')
+    parser.add_argument('--check', action='store_true', help='exit with status 1 on a regression')
+    parser.add_argument('--threshold', type=float, default=0.25, help='slowdown that counts as a regression')
+    parser.add_argument('--window', type=int, default=5, help='saved runs the baseline is taken from')
+    parser.add_argument('--history', default=HISTORY_FILE)
+    args = parser.parse_args()
+
+    this_machine = machine()
+    history = load_history(args.history, this_machine['node'])
+    results = {}
+    regressions = []
+    try:
+        print(f"{'benchmark':<32}{'ms/call':>12}{'baseline':>12}{'change':>9}")
+        for name, setup, param in BENCHMARKS:
+            if args.filter and args.filter not in name:
+                continue
+            seconds = measure(setup(param), args.repeat)
+            results[name] = seconds
+            base = baseline(history, name, args.window)
+            change = ''
+            if base:
+                ratio = seconds / base - 1
+                change = f'{ratio:+.0%}'
+                if ratio > args.threshold:
+                    regressions.append(name)
+                    change += ' !'
+            base_ms = f'{base * 1000:.3f}' if base else '-'
+            print(f"{name:<32}{seconds * 1000:>12.3f}{base_ms:>12}{change:>9}")
+    finally:
+        shutil.rmtree(_workdir, ignore_errors=True)
+
+    if args.save:
+        with open(args.history, 'a') as f:
+            f.write(json.dumps({'time': datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+                                'machine': this_machine, 'results': results}) + '\n')
+    if regressions:
+        print(f"\nSlower than the baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        if args.check:
+            sys.exit(1)
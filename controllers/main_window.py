@@ -1,5 +1,7 @@
-from PyQt6.QtWidgets import QMainWindow, QStackedWidget
+from PyQt6.QtWidgets import QMainWindow, QMessageBox, QStackedWidget
 from PyQt6.QtCore import Qt, QTimer, QEvent
+from controllers.storage_provider import storage_provider
+from views.login_view import LoginView
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -7,6 +9,14 @@ class MainWindow(QMainWindow):
         self.setup_ui()
         self.setup_security()
         
+        # Connect to storage in the background once the login screen is up;
+        # the window, not each view, reacts to the connection coming up or failing
+        provider = storage_provider()
+        provider.ready.connect(self.handle_storage_ready)
+        provider.failed.connect(self.handle_storage_failed)
+        self.login_view.submit_btn.setEnabled(provider.storage() is not None)
+        QTimer.singleShot(0, provider.start)
+        
     def setup_ui(self):
         """Setup the main window UI."""
         # Set window properties
@@ -17,15 +27,14 @@ class MainWindow(QMainWindow):
         self.stacked_widget = QStackedWidget()
         self.setCentralWidget(self.stacked_widget)
         
-        # Create views
+        # Create the login view; the exam and admin views are created on first
+        # use, so the exam's questions and timer only start after login
         self.login_view = LoginView(self)
-        self.exam_view = ExamView(self)
-        self.admin_view = AdminView(self)
+        self.exam_view = None
+        self.admin_view = None
         
         # Add views to stacked widget
         self.stacked_widget.addWidget(self.login_view)
-        self.stacked_widget.addWidget(self.exam_view)
-        self.stacked_widget.addWidget(self.admin_view)
         
         # Show login view by default
         self.show_login()
@@ -35,6 +44,10 @@ class MainWindow(QMainWindow):
         self.resize_timer.setSingleShot(True)
         self.resize_timer.timeout.connect(self.handle_resize_timeout)
         
+        # A view shown for the first time picks up the current breakpoint,
+        # once the stacked widget has given it its size
+        self.stacked_widget.currentChanged.connect(lambda index: self.resize_timer.start(0))
+        
     def setup_security(self):
         """Setup security features to prevent cheating."""
         # Set window flags to prevent minimize/maximize
@@ -85,6 +98,22 @@ class MainWindow(QMainWindow):
         if hasattr(current_view, 'adjust_responsive_layout'):
             current_view.adjust_responsive_layout()
             
+    def handle_storage_ready(self, storage):
+        """Storage is connected: allow logging in."""
+        self.login_view.submit_btn.setEnabled(True)
+        
+    def handle_storage_failed(self, error):
+        """Report a failed storage connection and offer to try again."""
+        choice = QMessageBox.critical(
+            self, "Connection Error", f"Could not connect to the exam server: {error}",
+            QMessageBox.StandardButton.Retry | QMessageBox.StandardButton.Cancel)
+        if choice == QMessageBox.StandardButton.Retry:
+            self.login_view.submit_btn.setEnabled(False)
+            storage_provider().start()
+        else:
+            # Leave logging in enabled, so a later click offers to try again
+            self.login_view.submit_btn.setEnabled(True)
+            
     def show_login(self):
         """Switch to login view."""
         self.stacked_widget.setCurrentWidget(self.login_view)
@@ -93,12 +122,19 @@ class MainWindow(QMainWindow):
         
     def show_exam(self):
         """Switch to exam view."""
+        if self.exam_view is None:
+            from views.exam_view import ExamView
+            self.exam_view = ExamView(self)
+            self.stacked_widget.addWidget(self.exam_view)
         self.stacked_widget.setCurrentWidget(self.exam_view)
         # Set fullscreen for exam view
         self.setWindowState(Qt.WindowState.WindowFullScreen)
         
     def show_admin(self):
         """Switch to admin view."""
+        if self.admin_view is None:
+            self.admin_view = AdminView(self)
+            self.stacked_widget.addWidget(self.admin_view)
         self.stacked_widget.setCurrentWidget(self.admin_view)
         # Reset window state for admin view
         self.setWindowState(Qt.WindowState.WindowMaximized)
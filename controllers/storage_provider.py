@@ -0,0 +1,61 @@
+import threading
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from storage import get_storage
+
+
+class StorageProvider(QObject):
+    """The desktop app's one storage connection, opened off the GUI thread.
+
+    get_storage() initializes Firebase (or opens the SQLite database) once
+    per process; the provider runs it on a background thread so the login
+    screen shows without waiting for it, and lets views ask for the
+    connection without blocking: storage() is None until it is ready.
+    MainWindow connects `ready` to enable logging in and `failed` to report
+    the error and offer to start() again. Background workers may call
+    get_storage() directly and share the same connection.
+    """
+
+    ready = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self):
+        super().__init__()
+        self._storage = None
+        self._thread = None
+        self.error = None  # Why the last attempt to connect failed
+
+    def start(self):
+        """Start connecting, unless already connected or connecting."""
+        if self._storage is not None or (self._thread is not None and self._thread.is_alive()):
+            return
+        self.error = None
+        self._thread = threading.Thread(target=self._connect, daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        try:
+            storage = get_storage()
+        except Exception as e:
+            print(f"Storage initialization error: {str(e)}")
+            self.error = str(e)
+            self.failed.emit(self.error)
+            return
+        self._storage = storage
+        self.ready.emit(storage)
+
+    def storage(self):
+        """The storage backend, or None until connected."""
+        return self._storage
+
+
+_provider = None
+
+
+def storage_provider():
+    """The process-wide StorageProvider."""
+    global _provider
+    if _provider is None:
+        _provider = StorageProvider()
+    return _provider
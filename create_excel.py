@@ -1,5 +1,7 @@
 import pandas as pd
 import os
+import sys
+from question_bank import BANK_FILE, COMPILED_FILE, compile_bank
 
 def get_next_course_number(existing_sheets):
     # Find the highest course number from existing sheets
@@ -116,6 +118,24 @@ def create_exam_excel():
             print("Each question carries 1 mark")
             print("\nFor 'Correct Answer' column, please enter A, B, C, or D (the option letter)")
 
+def compile_exam_bank():
+    if not os.path.exists(BANK_FILE):
+        print(f"\n'{BANK_FILE}' not found, nothing to compile")
+        return False
+
+    bank = compile_bank(BANK_FILE, COMPILED_FILE)
+    for section, count in bank.sections.items():
+        print(f"{section}: {count} questions")
+    print(f"Duration: {bank.duration} minutes")
+    print(f"\nCompiled question bank version {bank.version} written to '{COMPILED_FILE}'")
+    print("Re-run this step whenever the Excel file is edited")
+    return True
+
 if __name__ == "__main__":
-    create_exam_excel()
-    print("\nExcel file 'exam_questions.xlsx' has been created/updated successfully!") 
+    if len(sys.argv) > 1 and sys.argv[1] == 'compile':
+        if not compile_exam_bank():
+            sys.exit(1)
+    else:
+        create_exam_excel()
+        print("\nExcel file 'exam_questions.xlsx' has been created/updated successfully!")
+
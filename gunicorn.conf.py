@@ -0,0 +1,71 @@
+"""gunicorn settings for serving the exam app on every core of the exam server.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The master imports the app once and loads the question bank, scoring
+engine and question payload before forking, so every worker shares those
+pages copy-on-write. Storage connections and the background writers are
+started in each worker after the fork (neither survives one), each worker
+with a write journal of its own.
+
+Settings can be overridden from the environment:
+
+    EXAM_BIND        address to listen on (0.0.0.0:5000)
+    EXAM_WORKERS     worker processes (one per core)
+    EXAM_THREADS     threads per worker (8)
+    EXAM_KEEPALIVE   seconds an idle keep-alive connection stays open (5)
+    EXAM_METRICS_DIR directory where the workers' metrics are summed (metrics_data);
+                     emptied when the master starts
+
+`kill -HUP <master pid>` replaces the workers gracefully: running requests
+get `graceful_timeout` seconds to finish and each worker flushes its write
+queue on the way out. Code changes need a full restart, because the
+app is preloaded in the master.
+"""
+import gc
+import os
+import shutil
+
+# Tell app.py to leave the per-process start-up to post_fork
+os.environ['EXAM_PREFORK'] = '1'
+
+# Workers share their metrics through files, so any of them can answer a
+# scrape; start from an empty directory, but not again when a HUP re-reads this file
+os.environ.setdefault('EXAM_METRICS_DIR', 'metrics_data')
+if not os.environ.get('EXAM_METRICS_CLEARED'):
+    shutil.rmtree(os.environ['EXAM_METRICS_DIR'], ignore_errors=True)
+    os.environ['EXAM_METRICS_CLEARED'] = '1'
+
+bind = os.environ.get('EXAM_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('EXAM_WORKERS', os.cpu_count() or 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('EXAM_THREADS', 8))
+keepalive = int(os.environ.get('EXAM_KEEPALIVE', 5))
+backlog = 2048
+timeout = 60
+graceful_timeout = 30
+preload_app = True
+
+JOURNAL_FILE = 'write_journal.log'
+_journal_lock = None
+
+
+def pre_fork(server, worker):
+    # Objects loaded by the master are never freed; keeping them out of the
+    # workers' garbage collection stops it from touching (and copying) their pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    global _journal_lock
+    import app
+    from write_queue import claim_journal
+
+    journal_path, _journal_lock = claim_journal(JOURNAL_FILE)
+    app.start_worker(journal_path)
+    server.log.info(f"Worker {worker.pid} writing to {journal_path}")
+
+
+def worker_exit(server, worker):
+    import app
+    app.stop_worker()
@@ -0,0 +1,228 @@
+"""Load test: simulate a full exam slot against the real endpoints.
+
+    python loadtest.py [--candidates 300] [--duration 60] [--workers 4]
+    python loadtest.py --url http://exam-server:5000 ...
+
+Each simulated candidate opens the login page, logs in, loads the exam page
+and its questions, autosaves a few answers at jittered intervals and submits
+at the deadline, the way a real slot goes:
+
+    start      everybody logs in within --start-window seconds
+    exam       autosaves every --autosave-interval seconds (+/- 50%)
+    deadline   everybody submits within --submit-window seconds of the end
+
+The exam is compressed into --duration seconds. Unless --url is given the
+app is started in a temporary directory on the local SQLite backend
+(EXAM_STORAGE=sqlite), so nothing is written to Firebase. It uses a copy
+of --bank (exam_questions.xlsx), or a generated 3 x 50 question bank if
+that file does not exist.
+
+The report gives p50/p95/p99 latency, error count and throughput for every
+route; --json also writes it to a file so runs can be compared. Needs httpx
+(pip install httpx).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from question_bank import BANK_FILE
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Recorder:
+    """Latencies and errors per route."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)      # error responses and failed requests
+        self.failures = defaultdict(int)    # requests that got no response at all
+
+    async def request(self, client, route, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except Exception:
+            self.errors[route] += 1
+            self.failures[route] += 1
+            return None
+        self.latencies[route].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[route] += 1
+        return response
+
+    def report(self, elapsed):
+        routes = {}
+        for route in sorted(set(self.latencies) | set(self.errors)):
+            latencies = np.array(self.latencies[route]) * 1000
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0, 0, 0)
+            routes[route] = {
+                'requests': len(latencies) + self.failures[route],
+                'errors': self.errors[route],
+                'p50_ms': round(float(p50), 2),
+                'p95_ms': round(float(p95), 2),
+                'p99_ms': round(float(p99), 2),
+                'rps': round(len(latencies) / elapsed, 1) if elapsed > 0 else 0
+            }
+        total = sum(len(l) for l in self.latencies.values())
+        return {'elapsed_s': round(elapsed, 2), 'requests': total,
+                'rps': round(total / elapsed, 1) if elapsed > 0 else 0, 'routes': routes}
+
+
+async def candidate(number, base_url, recorder, args, exam_start):
+    import httpx
+
+    rng = random.Random(number)
+    deadline = exam_start + args.duration
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as client:
+        # Synchronized start
+        await asyncio.sleep(rng.uniform(0, args.start_window))
+        await recorder.request(client, '/login', 'GET', '/login')
+        await recorder.request(client, '/submit-login', 'POST', '/submit-login', data={
+            'name': f'Load Test {number}', 'dob': '2007-01-01', 'puCollege': f'College {number % 10}',
+            'stream': rng.choice(['PCMB', 'PCMC', 'Commerce']), 'mobile': f'9{number:09d}',
+            'address': 'Load test'
+        })
+        await recorder.request(client, '/exam', 'GET', '/exam')
+        response = await recorder.request(client, '/api/questions', 'GET', '/api/questions')
+        await recorder.request(client, '/api/questions/order', 'GET', '/api/questions/order')
+        bank = response.json() if response is not None and response.status_code == 200 else {}
+
+        # Answer a few questions between jittered autosaves until the deadline
+        answers = {}
+        seq = 0
+        loop = asyncio.get_running_loop()
+        while bank:
+            wait = args.autosave_interval * rng.uniform(0.5, 1.5)
+            if loop.time() + wait >= deadline:
+                break
+            await asyncio.sleep(wait)
+            changes = {}
+            for _ in range(rng.randint(1, 5)):
+                section = rng.choice(list(bank))
+                if bank[section]:
+                    original_id = str(rng.randrange(len(bank[section])))
+                    changes.setdefault(section, {})[original_id] = rng.choice('ABCD')
+            for section, section_changes in changes.items():
+                answers.setdefault(section, {}).update(section_changes)
+            seq += 1
+            await recorder.request(client, '/save-answers', 'POST', '/save-answers', json={
+                'seq': seq, 'changes': changes, 'timeRemaining': int(deadline - loop.time()),
+                'currentSection': next(iter(changes), '')
+            })
+
+        # Submission spike at the deadline
+        await asyncio.sleep(max(0, deadline - loop.time()) + rng.uniform(0, args.submit_window))
+        await recorder.request(client, '/submit-exam', 'POST', '/submit-exam', json={'answers': answers})
+
+
+async def run_slot(base_url, args):
+    recorder = Recorder()
+    exam_start = asyncio.get_running_loop().time() + args.start_window
+    started = time.perf_counter()
+    await asyncio.gather(*[candidate(i, base_url, recorder, args, exam_start)
+                           for i in range(args.candidates)])
+    return recorder.report(time.perf_counter() - started)
+
+
+def synthetic_bank(path, sections=3, questions=50):
+    import pandas as pd
+
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        for s in range(1, sections + 1):
+            pd.DataFrame({
+                'Question': [f'Section {s} question {q}: which option is correct?' for q in range(questions)],
+                'Option A': [f'First answer to question {q}' for q in range(questions)],
+                'Option B': [f'Second answer to question {q}' for q in range(questions)],
+                'Option C': [f'Third answer to question {q}' for q in range(questions)],
+                'Option D': [f'Fourth answer to question {q}' for q in range(questions)],
+                'Correct Answer': ['ABCD'[q % 4] for q in range(questions)],
+                'Duration': [120] + [None] * (questions - 1)
+            }).to_excel(writer, sheet_name=f'Course {s}', index=False)
+
+
+def start_server(args, workdir):
+    """Start the app on the SQLite backend in `workdir`; returns (process, base URL)."""
+    if os.path.exists(args.bank):
+        shutil.copy(args.bank, os.path.join(workdir, BANK_FILE))
+    else:
+        print(f"{args.bank} not found, using a generated question bank")
+        synthetic_bank(os.path.join(workdir, BANK_FILE))
+    env = dict(os.environ, EXAM_STORAGE='sqlite', EXAM_SQLITE_PATH=os.path.join(workdir, 'exam.db'),
+               PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    env['EXAM_BIND'] = f'127.0.0.1:{args.port}'
+    if args.workers:
+        env['EXAM_WORKERS'] = str(args.workers)
+    command = ['gunicorn', '-c', os.path.join(REPO_DIR, 'gunicorn.conf.py'), '--chdir', workdir, 'app:app']
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return process, f'http://127.0.0.1:{args.port}'
+
+
+def wait_until_up(base_url, timeout=30):
+    import httpx
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(base_url + '/login', timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f'Server at {base_url} did not come up within {timeout}s')
+
+
+def print_report(report):
+    print(f"\n{report['requests']} requests in {report['elapsed_s']}s ({report['rps']} req/s)\n")
+    print(f"{'route':<24}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>8}")
+    for route, stats in report['routes'].items():
+        print(f"{route:<24}{stats['requests']:>9}{stats['errors']:>8}{stats['p50_ms']:>9}"
+              f"{stats['p95_ms']:>9}{stats['p99_ms']:>9}{stats['rps']:>8}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate an exam slot against the exam app')
+    parser.add_argument('--candidates', type=int, default=300)
+    parser.add_argument('--duration', type=float, default=60, help='seconds from exam start to deadline')
+    parser.add_argument('--start-window', type=float, default=2, help='seconds over which candidates log in')
+    parser.add_argument('--autosave-interval', type=float, default=10)
+    parser.add_argument('--submit-window', type=float, default=3, help='seconds over which candidates submit')
+    parser.add_argument('--timeout', type=float, default=60, help='per-request timeout in seconds')
+    parser.add_argument('--url', help='test a running server instead of starting one')
+    parser.add_argument('--workers', type=int, help='gunicorn worker processes')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--bank', default=BANK_FILE, help='question workbook for the started server')
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args()
+
+    process = workdir = None
+    base_url = args.url
+    try:
+        if not base_url:
+            workdir = tempfile.mkdtemp(prefix='exam-loadtest-')
+            process, base_url = start_server(args, workdir)
+        wait_until_up(base_url)
+        print(f"Simulating {args.candidates} candidates against {base_url}")
+        report = asyncio.run(run_slot(base_url, args))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report['config'] = {key: value for key, value in vars(args).items() if key != 'json'}
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,146 @@
+"""Structured, non-blocking logging for the exam and admin apps.
+
+    setup_logging()              once per process (safe to call again)
+    log = logging.getLogger(__name__)
+    log.info('Exam submitted', extra={'student_id': sid, 'raw_score': 42})
+
+Records are put on an in-memory queue and written to stderr by a
+background thread, so a request never waits on the terminal or journald.
+If that thread falls behind by more than EXAM_LOG_QUEUE records, new ones
+are dropped (and counted) instead of blocking. Debug records are sampled:
+only one in EXAM_LOG_SAMPLE of each message is kept.
+
+    EXAM_LOG_LEVEL    DEBUG, INFO (default), WARNING, ...
+    EXAM_LOG_FORMAT   json (default) or text
+    EXAM_LOG_SAMPLE   keep one in N debug records per message (100)
+    EXAM_LOG_QUEUE    records buffered before dropping (10000)
+"""
+import atexit
+import copy
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else was passed in `extra`
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any `extra` fields alongside the message."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Plain text for a terminal, with `extra` fields appended as key=value."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = ' '.join(f'{key}={value}' for key, value in vars(record).items()
+                          if key not in _RECORD_FIELDS)
+        return f'{line} {fields}' if fields else line
+
+
+class DebugSampler(logging.Filter):
+    """Keep one in `rate` debug records of each message; other levels pass."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = max(1, rate)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate == 1:
+            return True
+        key = (record.name, record.msg)
+        counter = self._counters.get(key)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(key, itertools.count())
+        if next(counter) % self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue records without ever blocking; drops them when the queue is full."""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Resolve the message and traceback now, so the record can cross threads,
+        # but keep the traceback apart from the message
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+_listener = None
+_listener_pid = None
+
+
+def setup_logging():
+    """Route all logging through the queue; restarts the writer thread after a fork."""
+    global _listener, _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    # Threads do not survive a fork: a worker needs its own queue and writer
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, DroppingQueueHandler):
+            root.removeHandler(handler)
+
+    output = logging.StreamHandler()
+    if os.environ.get('EXAM_LOG_FORMAT', 'json') == 'text':
+        output.setFormatter(TextFormatter())
+    else:
+        output.setFormatter(JsonFormatter())
+
+    records = queue.Queue(maxsize=int(os.environ.get('EXAM_LOG_QUEUE', 10000)))
+    handler = DroppingQueueHandler(records)
+    handler.addFilter(DebugSampler(int(os.environ.get('EXAM_LOG_SAMPLE', 100))))
+    root.addHandler(handler)
+    root.setLevel(os.environ.get('EXAM_LOG_LEVEL', 'INFO').upper())
+
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+
+
+@atexit.register
+def _stop_listener():
+    # Write out whatever is still queued
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
@@ -0,0 +1,400 @@
+"""Request and component timings, served in Prometheus format.
+
+    metrics.init_app(app)    time every request and add GET /metrics
+
+Exported:
+
+    exam_request_duration_seconds{route}         histogram, per Flask route
+    exam_requests_total{route,status}            counter
+    exam_requests_in_flight                      gauge
+    exam_component_duration_seconds{component}   histogram of time spent in
+        storage (Firestore/SQLite calls), excel (workbook parsing),
+        scoring and template (rendering)
+    plus any gauge registered with gauge(), e.g. the write queue depth
+
+With EXAM_METRICS_DIR set (gunicorn.conf.py sets it), every process keeps
+its values in a memory-mapped file in that directory and /metrics sums the
+files of all processes, so whichever worker answers a scrape reports the
+totals: counters and histograms of every worker that ever ran, gauges of
+the ones still running. The directory must be emptied when the server
+starts. Without it, values are kept in memory for the one process.
+"""
+import inspect
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_DIR = os.environ.get('EXAM_METRICS_DIR')
+
+
+class _MemoryValues:
+    """This process's values by key, in memory."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def add(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, key, value):
+        with self._lock:
+            self._values[key] = value
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+class _FileValues:
+    """This process's values by key, in a memory-mapped file other processes read.
+
+    The file holds the number of bytes in use (8 bytes), then one entry per
+    key: its length (4 bytes), the JSON-encoded key padded to 8 bytes and
+    the value as an 8-byte double. Only the owning process writes it; a new
+    entry is written in full before the length in use is moved past it, so
+    a reader never sees half an entry.
+    """
+
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            size = self.INITIAL_SIZE
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._used = struct.unpack_from('Q', self._map, 0)[0] or 8
+        # A process that reuses a dead one's id carries on from its values
+        self._positions = {key: position for key, position, _ in _entries(self._map, self._used)}
+
+    def _position(self, key):
+        position = self._positions.get(key)
+        if position is None:
+            encoded = json.dumps(key).encode('utf-8')
+            padded = encoded + b' ' * (-(4 + len(encoded)) % 8)
+            entry = struct.pack('i', len(padded)) + padded + struct.pack('d', 0.0)
+            if self._used + len(entry) > len(self._map):
+                size = len(self._map)
+                while self._used + len(entry) > size:
+                    size *= 2
+                self._map.close()
+                self._file.truncate(size)
+                self._map = mmap.mmap(self._file.fileno(), size)
+            self._map[self._used:self._used + len(entry)] = entry
+            position = self._positions[key] = self._used + len(entry) - 8
+            self._used += len(entry)
+            struct.pack_into('Q', self._map, 0, self._used)
+        return position
+
+    def add(self, key, amount):
+        with self._lock:
+            position = self._position(key)
+            struct.pack_into('d', self._map, position, struct.unpack_from('d', self._map, position)[0] + amount)
+
+    def set(self, key, value):
+        with self._lock:
+            struct.pack_into('d', self._map, self._position(key), value)
+
+
+def _entries(data, used):
+    """(key, position of the value, value) of each entry in a values file."""
+    offset = 8
+    while offset + 4 <= used:
+        length = struct.unpack_from('i', data, offset)[0]
+        key = tuple(json.loads(bytes(data[offset + 4:offset + 4 + length])))
+        position = offset + 4 + length
+        yield key, position, struct.unpack_from('d', data, position)[0]
+        offset = position + 8
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _Values:
+    """Counter and gauge values of this process, and their totals over every process."""
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _local(self):
+        # Opened on first use in each process, so forked workers get files of their own
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    if self.directory:
+                        os.makedirs(self.directory, exist_ok=True)
+                        self._counters = _FileValues(os.path.join(self.directory, f'counters_{pid}.db'))
+                        self._gauges = _FileValues(os.path.join(self.directory, f'gauges_{pid}.db'))
+                    else:
+                        self._counters = _MemoryValues()
+                        self._gauges = _MemoryValues()
+                    self._pid = pid
+        return self
+
+    def add(self, key, amount=1):
+        self._local()._counters.add(key, amount)
+
+    def set(self, key, value):
+        self._local()._gauges.set(key, value)
+
+    def totals(self):
+        """{key: value} summed over all processes: counters of every process, gauges of running ones."""
+        local = self._local()
+        if not self.directory:
+            return dict(local._counters.items() + local._gauges.items())
+        totals = {}
+        for name in os.listdir(self.directory):
+            kind, _, pid = name.partition('_')
+            if not name.endswith('.db') or kind not in ('counters', 'gauges'):
+                continue
+            if kind == 'gauges' and not _is_running(int(pid[:-3])):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                continue
+            if len(data) < 8:
+                continue
+            used = min(struct.unpack_from('Q', data, 0)[0], len(data))
+            for key, _, value in _entries(data, used):
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+
+_values = _Values(METRICS_DIR)
+
+
+def _number(value):
+    return int(value) if float(value).is_integer() else value
+
+
+class Histogram:
+    def __init__(self, name, help_text, label, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+
+    def observe(self, label_value, seconds):
+        for bound in self.buckets:
+            if seconds <= bound:
+                _values.add((self.name, label_value, str(bound)))
+        _values.add((self.name, label_value, 'sum'), seconds)
+        _values.add((self.name, label_value, 'count'))
+
+    def render(self, totals):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        series = {}
+        for key, value in totals.items():
+            if key[0] == self.name:
+                series.setdefault(str(key[1]), {})[key[2]] = value
+        for label_value, values in sorted(series.items()):
+            label = f'{self.label}="{_escape(label_value)}"'
+            for bound in self.buckets:
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {_number(values.get(str(bound), 0))}')
+            count = _number(values.get('count', 0))
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label}}} {values.get("sum", 0)}')
+            lines.append(f'{self.name}_count{{{label}}} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+
+    def inc(self, *label_values):
+        _values.add((self.name,) + label_values)
+
+    def render(self, totals):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        series = sorted((tuple(map(str, key[1:])), value) for key, value in totals.items() if key[0] == self.name)
+        for label_values, value in series:
+            labels = ','.join(f'{name}="{_escape(v)}"' for name, v in zip(self.labels, label_values))
+            lines.append(f'{self.name}{{{labels}}} {_number(value)}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+request_duration = Histogram('exam_request_duration_seconds', 'Time to handle a request.', 'route')
+component_duration = Histogram('exam_component_duration_seconds',
+                               'Time spent in storage calls, workbook parsing, scoring and template rendering.',
+                               'component')
+requests_total = Counter('exam_requests_total', 'Requests handled.', ('route', 'status'))
+
+GAUGE_REFRESH_INTERVAL = 1.0  # seconds between updates of the registered gauges
+
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+_gauges = {}  # name -> (help text, function returning the current value)
+_refresher_pid = None
+
+
+def _track_in_flight(change):
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += change
+        _values.set(('exam_requests_in_flight',), _in_flight)
+
+
+def _refresh_gauges():
+    for name, (_, fn) in list(_gauges.items()):
+        try:
+            value = fn()
+        except Exception:
+            continue
+        _values.set((name,), value)
+
+
+def _refresh_loop():
+    while True:
+        _refresh_gauges()
+        time.sleep(GAUGE_REFRESH_INTERVAL)
+
+
+def gauge(name, help_text, fn):
+    """Export the value `fn()` returns as a gauge, summed over the running processes.
+
+    It is read at scrape time, and with EXAM_METRICS_DIR set also every
+    GAUGE_REFRESH_INTERVAL seconds, so a scrape answered by another worker
+    sees this one's value.
+    """
+    global _refresher_pid
+    _gauges[name] = (help_text, fn)
+    if METRICS_DIR and _refresher_pid != os.getpid():
+        _refresher_pid = os.getpid()
+        threading.Thread(target=_refresh_loop, name='metrics-gauges', daemon=True).start()
+
+
+@contextmanager
+def timed(component):
+    """Add the time spent in the block to a component's histogram."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        component_duration.observe(component, time.perf_counter() - started)
+
+
+def timed_call(component):
+    """Decorator form of timed()."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(component):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _timed_generator(component, fn):
+    # Time each step of the generator rather than just creating it
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        items = fn(*args, **kwargs)
+        while True:
+            with timed(component):
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+            yield item
+    return wrapper
+
+
+class TimedStorage:
+    """Wraps a storage backend so the time spent in each of its calls is recorded."""
+
+    def __init__(self, storage, component='storage'):
+        self._storage = storage
+        self._component = component
+
+    def __getattr__(self, name):
+        attr = getattr(self._storage, name)
+        if not inspect.ismethod(attr):
+            return attr
+        if inspect.isgeneratorfunction(attr):
+            return _timed_generator(self._component, attr)
+        return timed_call(self._component)(attr)
+
+
+def render():
+    _refresh_gauges()
+    totals = _values.totals()
+    lines = []
+    for metric in (request_duration, requests_total, component_duration):
+        lines.extend(metric.render(totals))
+    gauges = [('exam_requests_in_flight', 'Requests being handled right now.')]
+    gauges += sorted((name, help_text) for name, (help_text, _) in _gauges.items())
+    for name, help_text in gauges:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge',
+                  f'{name} {_number(totals.get((name,), 0))}']
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(app):
+    from flask import Response, g, request, template_rendered, before_render_template
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        _track_in_flight(1)
+
+    @app.after_request
+    def note_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def record_request(exc):
+        # Recorded at teardown rather than in after_request, so requests that
+        # end in an unhandled exception are counted, as 500s
+        if 'metrics_started' not in g:
+            return
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_duration.observe(route, time.perf_counter() - g.metrics_started)
+        requests_total.inc(route, 500 if exc is not None else g.get('metrics_status', 500))
+        _track_in_flight(-1)
+
+    def template_started(sender, template, context, **extra):
+        g.template_started = time.perf_counter()
+
+    def template_finished(sender, template, context, **extra):
+        if 'template_started' in g:
+            component_duration.observe('template', time.perf_counter() - g.template_started)
+
+    try:
+        before_render_template.connect(template_started, app, weak=False)
+        template_rendered.connect(template_finished, app, weak=False)
+    except RuntimeError:
+        pass  # Flask signals need blinker; without it templates are not timed
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
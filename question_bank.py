@@ -0,0 +1,212 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from typing import NamedTuple
+
+from metrics import timed_call
+
+BANK_FILE = 'exam_questions.xlsx'
+COMPILED_FILE = 'exam_questions.bank'
+COMPILED_MAGIC = b'EXAMBANK'
+COMPILED_FORMAT = 1
+OPTION_COLUMNS = ['Option A', 'Option B', 'Option C', 'Option D']
+
+log = logging.getLogger(__name__)
+
+
+class QuestionBank(NamedTuple):
+    """Parsed contents of the question workbook.
+
+    Built once per workbook version and shared by every request, so callers
+    must treat it (and the question records inside it) as read-only.
+    """
+    version: str
+    sections: dict          # sheet name -> number of questions
+    duration: int
+    total_questions: int
+    questions: dict         # sheet name -> tuple of question records, in sheet order
+    answer_keys: dict       # sheet name -> tuple of correct answers, indexed by original_id
+
+
+EMPTY_BANK = QuestionBank(version='', sections={}, duration=None, total_questions=0,
+                          questions={}, answer_keys={})
+
+_lock = threading.Lock()
+_cache = {'signature': None, 'bank': EMPTY_BANK}
+
+
+def truncate_text(text, max_length=50):
+    if not isinstance(text, str):
+        return ''
+    return (text[:max_length] + '...') if len(text) > max_length else text
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@timed_call('excel')
+def parse_workbook(path=BANK_FILE, version=None):
+    """Parse the question workbook into a QuestionBank."""
+    # pandas/openpyxl are only needed when the workbook actually has to be parsed
+    import pandas as pd
+
+    if version is None:
+        version = _file_hash(path)[:16]
+
+    sections = {}
+    duration = None
+    total_questions = 0
+    questions = {}
+    answer_keys = {}
+
+    with pd.ExcelFile(path) as xls:
+        # Total questions come from the TotalQuestions sheet, if present
+        if 'TotalQuestions' in xls.sheet_names:
+            try:
+                total_df = pd.read_excel(xls, sheet_name='TotalQuestions')
+                if 'Total' in total_df.columns:
+                    total_questions = int(total_df['Total'].iloc[0])
+            except Exception as e:
+                log.warning('Error reading TotalQuestions sheet: %s', e)
+
+        for sheet_name in xls.sheet_names:
+            if sheet_name == 'TotalQuestions':  # Metadata only, not a section
+                continue
+
+            raw_df = pd.read_excel(xls, sheet_name=sheet_name)
+
+            # Section counts and duration use whitespace-stripped column names
+            df = raw_df.copy()
+            df.columns = [str(col).strip() for col in df.columns]
+            if 'Question' in df.columns:
+                question_count = int(df['Question'].notna().sum())
+                if question_count > 0:
+                    sections[sheet_name] = question_count
+                    if 'Duration' in df.columns:
+                        duration_values = pd.to_numeric(df['Duration'], errors='coerce').dropna()
+                        if not duration_values.empty:
+                            first_value = duration_values.iloc[0]
+                            if 0 < first_value <= 180:
+                                duration = int(first_value)
+
+            # Question records served to candidates, in sheet order
+            df = raw_df.dropna(how='all')
+            if df.empty:
+                continue
+            for col in OPTION_COLUMNS:
+                if col in df.columns:
+                    df[col] = df[col].apply(lambda x: truncate_text(x, 100))
+            df = df.reset_index(drop=True)
+            df['original_id'] = df.index.astype(str)
+            records = tuple(df.fillna('').to_dict('records'))
+            questions[sheet_name] = records
+            answer_keys[sheet_name] = tuple(q.get('Correct Answer', '') for q in records)
+
+    return QuestionBank(version=version, sections=sections, duration=duration,
+                        total_questions=total_questions, questions=questions,
+                        answer_keys=answer_keys)
+
+
+def compile_bank(path=BANK_FILE, out_path=COMPILED_FILE):
+    """Parse the workbook and write it out as a compiled bank file.
+
+    The file is a magic header, a format version byte and a pickle of the
+    bank together with the size/mtime/hash of the workbook it came from.
+    """
+    st = os.stat(path)
+    version = _file_hash(path)[:16]
+    bank = parse_workbook(path, version=version)
+    payload = {
+        'source': {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'version': version},
+        'bank': bank._asdict(),
+    }
+    tmp_path = out_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(COMPILED_MAGIC + bytes([COMPILED_FORMAT]))
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, out_path)
+    return bank
+
+
+def load_compiled(path=COMPILED_FILE):
+    """Load a compiled bank file, returning (source info, QuestionBank)."""
+    with open(path, 'rb') as f:
+        header = f.read(len(COMPILED_MAGIC) + 1)
+        if header[:-1] != COMPILED_MAGIC:
+            raise ValueError(f"{path} is not a compiled question bank")
+        if header[-1] != COMPILED_FORMAT:
+            raise ValueError(f"{path} has format {header[-1]}, expected {COMPILED_FORMAT}")
+        payload = pickle.load(f)
+    return payload['source'], QuestionBank(**payload['bank'])
+
+
+def _stat(path):
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+
+def _load_current(path, compiled_path):
+    xlsx_st = _stat(path)
+
+    if _stat(compiled_path):
+        try:
+            source, bank = load_compiled(compiled_path)
+        except Exception as e:
+            log.warning('Error reading compiled question bank: %s', e)
+        else:
+            # Only trust the compiled bank while it still matches the workbook
+            if (xlsx_st is None
+                    or (xlsx_st.st_size, xlsx_st.st_mtime_ns) == (source['size'], source['mtime_ns'])
+                    or _file_hash(path)[:16] == source['version']):
+                return bank
+            log.warning("%s is out of date with %s, re-run 'python create_excel.py compile'", compiled_path, path)
+
+    if xlsx_st is None:
+        return EMPTY_BANK
+    version = _file_hash(path)[:16]
+    if _cache['bank'].version == version:
+        return _cache['bank']
+    return parse_workbook(path, version=version)
+
+
+def get_bank(path=BANK_FILE, compiled_path=COMPILED_FILE):
+    """Return the current QuestionBank, reloading only when its source changes.
+
+    A compiled bank file (see compile_bank) is preferred; the workbook is only
+    parsed when no up-to-date compiled file exists. Both files are stat'ed on
+    every call, and nothing is re-read unless their mtime or size moved.
+    """
+    xlsx_st = _stat(path)
+    bin_st = _stat(compiled_path)
+    signature = (
+        path, compiled_path,
+        xlsx_st and (xlsx_st.st_mtime_ns, xlsx_st.st_size),
+        bin_st and (bin_st.st_mtime_ns, bin_st.st_size),
+    )
+    if _cache['signature'] == signature:
+        return _cache['bank']
+
+    with _lock:
+        if _cache['signature'] == signature:
+            return _cache['bank']
+        try:
+            bank = _load_current(path, compiled_path)
+        except Exception:
+            log.exception('Error reading Excel file')
+            return _cache['bank']
+        if bank.version != _cache['bank'].version:
+            log.info('Loaded question bank', extra={'version': bank.version, 'sections': bank.sections})
+        else:
+            bank = _cache['bank']
+        _cache['signature'] = signature
+        _cache['bank'] = bank
+        return bank
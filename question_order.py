@@ -0,0 +1,46 @@
+"""Per-student question order.
+
+Each student sees every section in its own shuffled order. The order is a
+permutation derived from a PRNG seeded with a hash of the student id and
+the section name, so it is the same on every page load and on every
+worker, and nothing has to be stored for it. Only the permutation (two
+bytes per question) is cached; questions are looked up in the shared
+question bank when they are served. The exam page gets the bank and the
+order separately, so the bank payload itself is the same for everybody.
+"""
+import hashlib
+import random
+from array import array
+from functools import lru_cache
+
+
+def _seed(student_id, section):
+    digest = hashlib.sha256(f'{student_id}\0{section}'.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+@lru_cache(maxsize=8192)
+def permutation(student_id, section, count):
+    """Indexes into the section's questions, in the order the student sees them."""
+    order = list(range(count))
+    random.Random(_seed(student_id, section)).shuffle(order)
+    return array('H', order)
+
+
+def student_order(bank, student_id):
+    """Return {section: [index, ...]}, the student's order as sent to the exam page."""
+    return {
+        section: permutation(student_id, section, len(records)).tolist()
+        for section, records in bank.questions.items()
+    }
+
+
+def ordered_questions(bank, student_id):
+    """Return {section: [question, ...]} in the student's order, numbered from 1."""
+    questions = {}
+    for section, records in bank.questions.items():
+        questions[section] = [
+            dict(records[index], question_number=number)
+            for number, index in enumerate(permutation(student_id, section, len(records)), 1)
+        ]
+    return questions
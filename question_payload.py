@@ -0,0 +1,98 @@
+"""Precompressed /api/questions payloads.
+
+The question bank a candidate downloads is the same for everybody (each
+student's order is applied by the page, see question_order.py), so it is
+serialized and compressed once per bank version and then served from
+memory. Responses carry a strong ETag, suffixed per content encoding
+(-gz, -br) as each encoding is a representation of its own; a browser that
+revalidates gets a 304 without any body. Brotli is used when the `brotli` package is
+installed and the browser accepts it, gzip otherwise.
+
+Only what the page displays is sent; answer keys stay on the server in
+the bank's answer_keys. Each section is an array of
+[question, option A, option B, option C, option D] rows in sheet order,
+so a row's position is the question's original_id.
+"""
+import gzip
+import hashlib
+import json
+import threading
+from typing import NamedTuple, Optional
+
+from flask import Response
+
+from question_bank import OPTION_COLUMNS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ETAG_SUFFIXES = {'gzip': 'gz', 'br': 'br'}  # Content-Encoding -> suffix of its ETag
+
+
+class Payload(NamedTuple):
+    etag: str
+    body: bytes
+    gzip: bytes
+    br: Optional[bytes]
+
+
+_payloads = {}
+_payloads_lock = threading.Lock()
+
+
+def question_rows(bank):
+    """The candidate-facing projection of the bank: {section: [[question, A, B, C, D], ...]}."""
+    return {
+        section: [
+            [q.get('Question', '')] + [q.get(col, '') for col in OPTION_COLUMNS]
+            for q in records
+        ]
+        for section, records in bank.questions.items()
+    }
+
+
+def encode_payload(data):
+    body = json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return Payload(
+        etag=hashlib.sha256(body).hexdigest()[:32],
+        body=body,
+        gzip=gzip.compress(body, compresslevel=9, mtime=0),
+        br=brotli.compress(body, quality=11) if brotli else None
+    )
+
+
+def cached_payload(key, build):
+    """Return the payload stored under `key`, encoding `build()` the first time."""
+    with _payloads_lock:
+        payload = _payloads.get(key)
+        if payload is None:
+            payload = encode_payload(build())
+            _payloads.clear()  # Only the current bank version is ever served
+            _payloads[key] = payload
+        return payload
+
+
+def payload_response(payload, request, cache_control='public, no-cache'):
+    """Serve a payload, answering 304 if the browser already has this version."""
+    accepted = request.accept_encodings
+    if payload.br is not None and accepted['br']:
+        body, encoding = payload.br, 'br'
+    elif accepted['gzip']:
+        body, encoding = payload.gzip, 'gzip'
+    else:
+        body, encoding = payload.body, None
+
+    # Each encoding is a different representation, so it gets its own strong ETag
+    etag = f'{payload.etag}-{ETAG_SUFFIXES[encoding]}' if encoding else payload.etag
+    headers = {
+        'ETag': f'"{etag}"',
+        'Cache-Control': cache_control,
+        'Vary': 'Accept-Encoding'
+    }
+    if etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(body, mimetype='application/json', headers=headers)
@@ -0,0 +1,158 @@
+"""Re-score every submitted exam against the current question bank.
+
+Run this after correcting a `Correct Answer` in exam_questions.xlsx (and
+re-compiling it, if a compiled bank is used):
+
+    python rescore.py [--batch-size 500] [--restart]
+
+Students are streamed in document-id order one page at a time, each page is
+scored with the batch scoring engine and written back in a single batch
+commit. The cursor after the last committed page is checkpointed to disk, so
+an interrupted run picks up where it stopped unless --restart is given.
+Set EXAM_STORAGE=sqlite to re-score a local database instead of Firestore.
+"""
+import argparse
+import json
+import os
+import time
+
+from question_bank import get_bank
+from score_stats import rebuild_stats, student_totals
+from scoring import UNANSWERED, UNRECOGNISED, get_engine, section_scores
+from storage import get_storage
+from write_queue import MAX_BATCH_WRITES
+
+CHECKPOINT_FILE = 'rescore_checkpoint.json'
+
+
+def stored_answers(data):
+    """Return the raw {section: {original_id: answer}} of a student document.
+
+    Submissions without a top-level `answers` map are rebuilt from each
+    section's answer string, or from the `debug` entries of older ones.
+    """
+    answers = data.get('answers')
+    if isinstance(answers, dict):
+        return answers
+    answers = {}
+    for section, section_data in (data.get('scores') or {}).items():
+        if not isinstance(section_data, dict):
+            continue
+        if 'debug' in section_data:
+            answers[section] = {
+                str(q.get('q_num')): q.get('student')
+                for q in section_data['debug'] if q.get('student')
+            }
+        elif 'answers' in section_data:
+            answers[section] = {
+                str(i): answer for i, answer in enumerate(section_data['answers'])
+                if answer not in (UNANSWERED, UNRECOGNISED)
+            }
+    return answers
+
+
+def rescore_page(bank, engine, page_answers):
+    """Score a page of submissions; returns one `scores` dict per submission."""
+    results = [{} for _ in page_answers]
+    sections = {section for answers in page_answers for section in answers}
+    for section in sections:
+        rows = [i for i, answers in enumerate(page_answers) if section in answers]
+        submissions = [page_answers[i].get(section) or {} for i in rows]
+        counts, masks = engine.score_batch(section, engine.encode_batch(section, submissions))
+        for i, section_answers, count, mask in zip(rows, submissions, counts, masks):
+            results[i][section] = section_scores(bank, section, section_answers, int(count), mask)
+    return results
+
+
+def load_checkpoint(path, version):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('version') != version:
+        print(f"Checkpoint is for question bank {checkpoint.get('version')}, starting over")
+        return None
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def rescore_all(storage, batch_size=MAX_BATCH_WRITES, checkpoint_path=CHECKPOINT_FILE, restart=False):
+    batch_size = max(1, min(batch_size, MAX_BATCH_WRITES))
+    bank = get_bank()
+    if not bank.sections:
+        print("No question bank found, nothing to re-score against")
+        return None
+    engine = get_engine(bank)
+    total_sum = sum(bank.sections.values())
+
+    checkpoint = None if restart else load_checkpoint(checkpoint_path, bank.version)
+    if checkpoint is None:
+        checkpoint = {'version': bank.version, 'cursor': None, 'processed': 0, 'updated': 0}
+    else:
+        print(f"Resuming after {checkpoint['processed']} already processed students")
+
+    started = time.time()
+    processed_this_run = 0
+
+    while True:
+        page, next_cursor = storage.query_students(cursor=checkpoint.get('cursor'), limit=batch_size,
+                                                   sort=None, order='asc')
+        if not page:
+            break
+
+        submitted = []
+        for student_id, data in page:
+            if data.get('completion_time'):  # Only students who submitted the exam
+                submitted.append((student_id, stored_answers(data)))
+
+        if submitted:
+            results = rescore_page(bank, engine, [answers for _, answers in submitted])
+            ops = []
+            for (student_id, _), scores in zip(submitted, results):
+                raw_score, _, normalized_score, _ = student_totals(scores, bank.total_questions)
+                ops.append(('update', 'students', student_id, {
+                    'scores': scores,
+                    'total_questions': total_sum,
+                    'total_score': raw_score,
+                    'normalized_score': normalized_score
+                }))
+            storage.commit(ops)
+
+        checkpoint['cursor'] = next_cursor
+        checkpoint['processed'] += len(page)
+        checkpoint['updated'] += len(submitted)
+        save_checkpoint(checkpoint_path, checkpoint)
+
+        processed_this_run += len(page)
+        elapsed = time.time() - started
+        rate = processed_this_run / elapsed if elapsed > 0 else 0
+        print(f"Processed {checkpoint['processed']} students "
+              f"({checkpoint['updated']} re-scored), {rate:.0f} students/s")
+
+        if not next_cursor:
+            break
+
+    print(f"\nRe-scoring finished: {checkpoint['updated']} of {checkpoint['processed']} "
+          f"students re-scored against question bank {bank.version}")
+    # The running dashboard statistics are based on the old scores
+    rebuild_stats(storage, bank.total_questions)
+    print("Dashboard statistics rebuilt")
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return checkpoint
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Re-score all submitted exams against the current question bank')
+    parser.add_argument('--batch-size', type=int, default=MAX_BATCH_WRITES,
+                        help=f'students per page and per batch commit (max {MAX_BATCH_WRITES})')
+    parser.add_argument('--restart', action='store_true',
+                        help='ignore any saved checkpoint and start from the first student')
+    args = parser.parse_args()
+    rescore_all(get_storage(), batch_size=args.batch_size, restart=args.restart)
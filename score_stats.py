@@ -0,0 +1,176 @@
+"""Running score statistics for the admin dashboard.
+
+Instead of re-reading every student to work out the dashboard header, a
+single summary document (stats/summary) keeps running totals. Each login
+counts a student with a score of 0 and each scored exam moves that student
+to their real score, matching what the dashboard used to compute:
+
+    count, raw_sum, normalized_sum     -- for averages
+    raw_histogram, normalized_histogram -- {score: students}, for the maximum
+    sections                            -- {section: {count, sum, histogram}}
+
+Normalized scores are out of 100, computed the same way the dashboard does.
+
+A summary built from the students collection carries 'version'. One that
+lacks it (or has an older one) was started by increments alone, e.g. the
+first login after a deploy, and misses earlier students; load_stats()
+rebuilds it. A rebuild reads the students and writes the summary in one
+storage transaction, and every increment is committed together with the
+student write it accounts for, so increments land either wholly before the
+rebuild (and are counted by it) or wholly after it.
+
+The write queue may deliver an entry twice (see write_queue.py), so each
+increment travels with the creation of a marker document of its own in
+stats_applied (increment_ops()); a second delivery fails on the marker as a
+whole and is skipped instead of counting the student again.
+"""
+import uuid
+
+STATS_COLLECTION = 'stats'
+STATS_DOCUMENT = 'summary'
+STATS_APPLIED_COLLECTION = 'stats_applied'
+STATS_VERSION = 1
+
+
+def normalize(score, total):
+    return round((score / total * 100) if total > 0 else 0)
+
+
+def student_totals(scores, total_questions_from_excel=0):
+    """Return (raw score, total questions, normalized score, {section: normalized}) for a student."""
+    raw_score = 0
+    section_totals = {}
+    section_normalized = {}
+    for section, section_data in (scores or {}).items():
+        if not isinstance(section_data, dict):
+            continue
+        section_total = section_data.get('total_questions', 0)
+        section_score = section_data.get('marks', 0)
+        section_totals[section] = section_total
+        if isinstance(section_score, (int, float)):
+            raw_score += section_score
+            section_normalized[section] = normalize(section_score, section_total)
+    total_questions = total_questions_from_excel if total_questions_from_excel > 0 else sum(section_totals.values())
+    return raw_score, total_questions, normalize(raw_score, total_questions), section_normalized
+
+
+def increment_ops(delta):
+    """Write operations adding `delta` to the summary exactly once; enqueue them
+    together with the student write the delta accounts for."""
+    return [('create', STATS_APPLIED_COLLECTION, uuid.uuid4().hex, {}),
+            ('increment', STATS_COLLECTION, STATS_DOCUMENT, delta)]
+
+
+def login_increment():
+    """Deltas for a student who has just logged in (counted with a score of 0)."""
+    return {
+        'count': 1,
+        'raw_histogram': {'0': 1},
+        'normalized_histogram': {'0': 1}
+    }
+
+
+def _move(old_score, new_score):
+    histogram = {str(old_score): -1}
+    histogram[str(new_score)] = histogram.get(str(new_score), 0) + 1
+    return histogram
+
+
+def submit_increment(raw_score, normalized_score, section_normalized, previous=None):
+    """Deltas for a logged-in student whose exam has just been scored.
+
+    `previous` is the (raw score, normalized score, {section: normalized}) of
+    an earlier submission this one replaces; without it the student moves
+    from the score of 0 they were counted with at login.
+    """
+    old_raw, old_normalized, old_sections = previous or (0, 0, {})
+    sections = {}
+    for section in set(old_sections) | set(section_normalized):
+        delta = sections[section] = {'count': 0, 'sum': 0, 'histogram': {}}
+        for score, sign in ((old_sections.get(section), -1), (section_normalized.get(section), 1)):
+            if score is not None:
+                delta['count'] += sign
+                delta['sum'] += sign * score
+                delta['histogram'][str(score)] = delta['histogram'].get(str(score), 0) + sign
+    return {
+        'raw_sum': raw_score - old_raw,
+        'normalized_sum': normalized_score - old_normalized,
+        'raw_histogram': _move(old_raw, raw_score),
+        'normalized_histogram': _move(old_normalized, normalized_score),
+        'sections': sections
+    }
+
+
+def _add(summary, delta):
+    for key, value in delta.items():
+        if isinstance(value, dict):
+            _add(summary.setdefault(key, {}), value)
+        else:
+            summary[key] = summary.get(key, 0) + value
+
+
+def build_summary(students, total_questions_from_excel=0):
+    """Compute the summary document from scratch from an iterable of student dicts."""
+    summary = {'version': STATS_VERSION, 'total_questions': total_questions_from_excel,
+               'count': 0, 'raw_sum': 0, 'normalized_sum': 0,
+               'raw_histogram': {}, 'normalized_histogram': {}, 'sections': {}}
+    for data in students:
+        _add(summary, login_increment())
+        if data.get('completion_time'):  # Only submitted exams have real scores
+            raw_score, _, normalized_score, section_normalized = student_totals(
+                data.get('scores', {}), total_questions_from_excel)
+            _add(summary, submit_increment(raw_score, normalized_score, section_normalized))
+    return summary
+
+
+def _highest(histogram):
+    scores = [float(score) for score, count in (histogram or {}).items() if count > 0]
+    if not scores:
+        return 0
+    highest = max(scores)
+    return int(highest) if highest.is_integer() else highest
+
+
+def summarize(summary):
+    """Turn a summary document into the dashboard's stats values."""
+    summary = summary or {}
+    count = summary.get('count', 0)
+    return {
+        'total_students': count,
+        'highest_score': _highest(summary.get('normalized_histogram')),
+        'average_score': round(summary.get('normalized_sum', 0) / count) if count > 0 else 0,
+        'highest_raw_score': _highest(summary.get('raw_histogram')),
+        'average_raw_score': round(summary.get('raw_sum', 0) / count) if count > 0 else 0,
+        'sections': {
+            section: {
+                'highest_score': _highest(section_data.get('histogram')),
+                'average_score': round(section_data.get('sum', 0) / section_data['count']) if section_data.get('count') else 0
+            }
+            for section, section_data in summary.get('sections', {}).items()
+        }
+    }
+
+
+def load_stats(storage, total_questions_from_excel=0):
+    """Read the summary document, building it from the students collection if it was never built.
+
+    The summary records the TotalQuestions it normalized scores by. Pass the
+    bank's (as the submit increments use it); a summary built with another
+    one is rebuilt. Without one (0, e.g. no bank at hand) the recorded one
+    is kept.
+    """
+    summary = storage.get(STATS_COLLECTION, STATS_DOCUMENT)
+    if summary is not None and summary.get('version') == STATS_VERSION:
+        if not total_questions_from_excel or summary.get('total_questions') == total_questions_from_excel:
+            return summarize(summary)
+    elif summary is not None and not total_questions_from_excel:
+        total_questions_from_excel = summary.get('total_questions', 0)
+    return summarize(rebuild_stats(storage, total_questions_from_excel))
+
+
+def rebuild_stats(storage, total_questions_from_excel=0):
+    """Recompute the summary document from every student and store it, in one transaction."""
+    return storage.rebuild_document(
+        STATS_COLLECTION, STATS_DOCUMENT,
+        lambda students: build_summary(students, total_questions_from_excel),
+        fields=['completion_time', 'scores'])
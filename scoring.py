@@ -0,0 +1,188 @@
+import base64
+import threading
+
+import numpy as np
+
+from question_bank import get_bank
+
+# Option letters are scored as small integer codes. Answer keys that are not
+# one of A-D get their own codes (5, 6, ...) per section so that they still
+# compare case-insensitively, exactly like the old string comparison.
+OPTION_CODES = {'A': 1, 'B': 2, 'C': 3, 'D': 4}
+NO_ANSWER = 0   # unanswered / unrecognised student answer
+NO_KEY = -1     # question without a correct answer; never matches
+UNANSWERED = '-'    # answer string character for a question left blank
+UNRECOGNISED = '?'  # answer string character for anything but a single letter
+
+_lock = threading.Lock()
+_engines = {}
+
+
+def normalize_answer(answer):
+    """The form answers and keys are compared in: case and surrounding spaces ignored."""
+    return str(answer).strip().upper()
+
+
+class ScoringEngine:
+    """Answer keys of one question bank version, precompiled to code arrays.
+
+    Student answers are mapped into the same code space, so scoring a
+    section is a single vectorised comparison against the key array.
+    """
+
+    def __init__(self, bank):
+        self.version = bank.version
+        self.sections = bank.sections
+        self.keys = {}
+        self.vocab = {}
+        for section, answers in bank.answer_keys.items():
+            vocab = dict(OPTION_CODES)
+            key = np.full(len(answers), NO_KEY, dtype=np.int16)
+            for i, answer in enumerate(answers):
+                if answer is None or answer == '':
+                    continue
+                answer = normalize_answer(answer)
+                if answer not in vocab:
+                    vocab[answer] = len(vocab) + 1
+                key[i] = vocab[answer]
+            key.setflags(write=False)
+            self.keys[section] = key
+            self.vocab[section] = vocab
+
+    def question_count(self, section):
+        key = self.keys.get(section)
+        return 0 if key is None else len(key)
+
+    def encode(self, section, section_answers):
+        """Map {original_id: 'A'} for one section onto an array of option codes."""
+        size = self.question_count(section)
+        codes = np.zeros(size, dtype=np.int16)
+        vocab = self.vocab.get(section, OPTION_CODES)
+        for q_num, answer in (section_answers or {}).items():
+            if not answer:
+                continue
+            try:
+                index = int(q_num)
+            except (TypeError, ValueError):
+                continue
+            if 0 <= index < size:
+                codes[index] = vocab.get(normalize_answer(answer), NO_ANSWER)
+        return codes
+
+    def encode_batch(self, section, submissions):
+        """Stack the section answers of many submissions into an (N, Q) matrix."""
+        matrix = np.zeros((len(submissions), self.question_count(section)), dtype=np.int16)
+        for row, section_answers in enumerate(submissions):
+            matrix[row] = self.encode(section, section_answers)
+        return matrix
+
+    def score_codes(self, section, codes):
+        """Return (correct count, match mask) for one encoded submission."""
+        key = self.keys.get(section)
+        if key is None:
+            return 0, np.zeros(0, dtype=bool)
+        mask = codes == key
+        return int(np.count_nonzero(mask)), mask
+
+    def score_batch(self, section, matrix):
+        """Score an (N, Q) code matrix; returns (N correct counts, (N, Q) match masks)."""
+        key = self.keys.get(section)
+        if key is None:
+            return np.zeros(len(matrix), dtype=np.int64), np.zeros((len(matrix), 0), dtype=bool)
+        masks = matrix == key[np.newaxis, :]
+        return masks.sum(axis=1), masks
+
+    def score_section(self, section, section_answers):
+        return self.score_codes(section, self.encode(section, section_answers))
+
+    def score(self, answers):
+        """Score a whole submission ({section: {original_id: answer}}).
+
+        Returns {section: (correct count, match mask)} for each answered section.
+        """
+        return {section: self.score_section(section, section_answers)
+                for section, section_answers in answers.items()}
+
+
+def answer_string(section_answers, count):
+    """One character per question in sheet order: the chosen option letter, '-' or '?'."""
+    chars = [UNANSWERED] * count
+    for q_num, answer in (section_answers or {}).items():
+        if not answer:
+            continue
+        try:
+            index = int(q_num)
+        except (TypeError, ValueError):
+            continue
+        if 0 <= index < count:
+            answer = normalize_answer(answer)
+            chars[index] = answer if len(answer) == 1 else UNRECOGNISED
+    return ''.join(chars)
+
+
+def pack_mask(mask):
+    """Pack a match mask into a base64 bitmap, one bit per question."""
+    return base64.b64encode(np.packbits(np.asarray(mask, dtype=bool)).tobytes()).decode('ascii')
+
+
+def unpack_mask(bitmap, count):
+    bits = np.unpackbits(np.frombuffer(base64.b64decode(bitmap), dtype=np.uint8), count=count)
+    return bits.astype(bool)
+
+
+def section_scores(bank, section, section_answers, correct_count, mask):
+    """Build the per-section entry stored under a student's `scores`.
+
+    Per-question results are kept as an answer string and a correctness
+    bitmap, both in sheet order; question text and correct answers are
+    looked up in the question bank when they are shown (see question_results).
+    """
+    return {
+        'correct_answers': correct_count,
+        'total_questions': bank.sections.get(section, 0),  # Use the count from Excel
+        'marks': correct_count,
+        'answers': answer_string(section_answers, len(mask)),
+        'correct_bitmap': pack_mask(mask)
+    }
+
+
+def question_results(bank, section, section_data):
+    """Per-question results of a stored section entry, in sheet order.
+
+    Returns a list of {q_num, question, correct, student, match} dicts. Older
+    submissions stored this list themselves under `debug`.
+    """
+    if 'debug' in section_data:
+        return section_data['debug']
+    if 'answers' not in section_data:
+        return []
+    answers = section_data['answers']
+    matches = unpack_mask(section_data.get('correct_bitmap', ''), len(answers))
+    records = bank.questions.get(section, ())
+    keys = bank.answer_keys.get(section, ())
+    return [
+        {
+            'q_num': str(i),
+            'question': records[i].get('Question', '') if i < len(records) else '',
+            'correct': keys[i] if i < len(keys) else '',
+            'student': answer if answer != UNANSWERED else None,
+            'match': bool(match)
+        }
+        for i, (answer, match) in enumerate(zip(answers, matches))
+    ]
+
+
+def get_engine(bank=None):
+    """Return the ScoringEngine for the given (default: current) question bank."""
+    if bank is None:
+        bank = get_bank()
+    engine = _engines.get(bank.version)
+    if engine is None:
+        with _lock:
+            engine = _engines.get(bank.version)
+            if engine is None:
+                engine = ScoringEngine(bank)
+                # Only the current bank version is ever needed
+                _engines.clear()
+                _engines[bank.version] = engine
+    return engine
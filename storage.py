@@ -0,0 +1,421 @@
+"""Storage backends for students, submissions, questions and statistics.
+
+Everything that reads or writes exam data goes through one of these
+backends instead of talking to Firestore directly:
+
+    FirestoreStorage   the production Firebase project
+    SQLiteStorage      a local database file (WAL mode), for a single exam
+                       hall, offline runs and load tests
+
+Both take the same write operations the write-behind queue journals:
+(kind, collection, document id, data) tuples with kind one of 'set',
+'update', 'merge', 'increment' or 'create' (fails if the document exists). Pick the backend with the EXAM_STORAGE
+environment variable ('firestore', the default, or 'sqlite'); the SQLite
+file is EXAM_SQLITE_PATH (exam.db by default).
+"""
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+SORT_FIELDS = {
+    'score': 'normalized_score',
+    'name': 'name',
+    'exam_date': 'exam_date',
+}
+DOCUMENT_ID = '__name__'  # Field path Firestore uses for ordering by document id
+
+
+class DocumentNotFound(KeyError):
+    """An 'update' named a document that does not exist."""
+
+
+class DocumentExists(KeyError):
+    """A 'create' named a document that already exists."""
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """The [sort value, document id] (or [document id]) a cursor names; ValueError if malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError('Invalid cursor')
+    if (not isinstance(values, list) or len(values) not in (1, 2) or not isinstance(values[-1], str)
+            or not all(value is None or isinstance(value, (str, int, float)) for value in values)):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def _project(data, fields):
+    if not fields:
+        return data
+    return {field: data[field] for field in fields if field in data}
+
+
+def _merge(target, data):
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = value
+
+
+def _increment(target, data):
+    for key, value in data.items():
+        if isinstance(value, dict):
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            _increment(target[key], value)
+        else:
+            current = target.get(key)
+            target[key] = (current if isinstance(current, (int, float)) else 0) + value
+
+
+class FirestoreStorage:
+    """Exam data kept in Cloud Firestore."""
+
+    def __init__(self, credentials_path='serviceAccountKey.json'):
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+        from google.api_core.exceptions import AlreadyExists, FailedPrecondition, InvalidArgument, NotFound
+
+        try:
+            firebase_admin.get_app()
+        except ValueError:
+            firebase_admin.initialize_app(credentials.Certificate(credentials_path))
+        self._firestore = firestore
+        self.db = firestore.client()
+        # Writes rejected with these can never succeed, however often they are retried
+        self.permanent_errors = (NotFound, InvalidArgument, FailedPrecondition)
+        # Writes rejected with these were applied by an earlier attempt
+        self.applied_errors = (AlreadyExists,)
+
+    def new_id(self, collection):
+        return self.db.collection(collection).document().id
+
+    def get(self, collection, doc_id):
+        snapshot = self.db.collection(collection).document(doc_id).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def _as_increments(self, data):
+        return {key: self._as_increments(value) if isinstance(value, dict) else self._firestore.Increment(value)
+                for key, value in data.items()}
+
+    def commit(self, ops):
+        batch = self.db.batch()
+        for kind, collection, doc_id, data in ops:
+            ref = self.db.collection(collection).document(doc_id)
+            if kind == 'set':
+                batch.set(ref, data)
+            elif kind == 'merge':
+                batch.set(ref, data, merge=True)
+            elif kind == 'increment':
+                batch.set(ref, self._as_increments(data), merge=True)
+            elif kind == 'create':
+                batch.create(ref, data)
+            else:
+                batch.update(ref, data)
+        batch.commit()
+
+    def query_students(self, cursor=None, limit=50, sort='exam_date', order='desc', college=None,
+                       stream=None, min_score=None, max_score=None, fields=None):
+        """Fetch one page of students; returns ([(id, data), ...], next cursor or None).
+
+        With sort=None students come in document id order.
+        """
+        Query = self._firestore.Query
+        sort_field = SORT_FIELDS[sort] if sort else None
+        if min_score is not None or max_score is not None:
+            # Firestore requires a range-filtered field to be the first sort field
+            sort_field = SORT_FIELDS['score']
+        direction = Query.ASCENDING if order == 'asc' else Query.DESCENDING
+
+        query = self.db.collection('students')
+        if college:
+            query = query.where('puCollege', '==', college)
+        if stream:
+            query = query.where('stream', '==', stream)
+        if min_score is not None:
+            query = query.where(sort_field, '>=', min_score)
+        if max_score is not None:
+            query = query.where(sort_field, '<=', max_score)
+        if sort_field:
+            query = query.order_by(sort_field, direction=direction)
+        query = query.order_by(DOCUMENT_ID, direction=direction)
+        if fields:
+            query = query.select(fields)
+        if cursor:
+            values = decode_cursor(cursor)
+            if sort_field:
+                query = query.start_after({sort_field: values[0], DOCUMENT_ID: values[1]})
+            else:
+                query = query.start_after({DOCUMENT_ID: values[0]})
+
+        docs = list(query.limit(limit).stream())
+        next_cursor = None
+        if len(docs) == limit:
+            last = docs[-1]
+            next_cursor = encode_cursor([last.get(sort_field), last.id] if sort_field else [last.id])
+        return [(doc.id, doc.to_dict()) for doc in docs], next_cursor
+
+    def stream_students(self, fields=None):
+        query = self.db.collection('students')
+        if fields:
+            query = query.select(fields)
+        for doc in query.stream():
+            yield doc.id, doc.to_dict()
+
+    def rebuild_document(self, collection, doc_id, build, fields=None):
+        """Set a document to build(student dicts) in one transaction with reading the students.
+
+        Batches that write a student the transaction has read wait for it to
+        commit, so each one lands wholly before or after the rebuild. `build`
+        may be called again if the transaction is retried.
+        """
+        @self._firestore.transactional
+        def rebuild(transaction):
+            query = self.db.collection('students')
+            if fields:
+                query = query.select(fields)
+            data = build(doc.to_dict() for doc in query.stream(transaction=transaction))
+            transaction.set(self.db.collection(collection).document(doc_id), data)
+            return data
+
+        return rebuild(self.db.transaction())
+
+    def stream_questions(self):
+        for doc in self.db.collection('questions').stream():
+            data = doc.to_dict()
+            data.setdefault('id', doc.id)
+            yield data
+
+    def list_questions(self):
+        return list(self.stream_questions())
+
+    def questions_version(self):
+        """A value that changes whenever a question is added, edited or deleted.
+
+        Firestore stamps every document with its update time, so this reads
+        only the document names and times, not the questions themselves.
+        """
+        digest = hashlib.sha1()
+        for doc in self.db.collection('questions').select([DOCUMENT_ID]).stream():
+            digest.update(f'{doc.id}\0{doc.update_time.isoformat()}\n'.encode('utf-8'))
+        return digest.hexdigest()
+
+
+class SQLiteStorage:
+    """Exam data kept in a local SQLite database in WAL mode.
+
+    Students live in their own table with the fields the admin lists sort
+    and filter on copied into indexed columns; every other collection is a
+    plain (collection, id) -> JSON document table.
+    """
+
+    # Indexed student columns and the document fields they mirror
+    STUDENT_COLUMNS = {
+        'name': 'name',
+        'college': 'puCollege',
+        'stream': 'stream',
+        'exam_date': 'exam_date',
+        'normalized_score': 'normalized_score',
+    }
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS students (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            college TEXT,
+            stream TEXT,
+            exam_date TEXT,
+            normalized_score REAL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS students_score ON students (normalized_score, id);
+        CREATE INDEX IF NOT EXISTS students_name ON students (name, id);
+        CREATE INDEX IF NOT EXISTS students_exam_date ON students (exam_date, id);
+        CREATE INDEX IF NOT EXISTS students_college ON students (college, normalized_score, id);
+        CREATE INDEX IF NOT EXISTS students_stream ON students (stream, normalized_score, id);
+        CREATE TABLE IF NOT EXISTS documents (
+            collection TEXT NOT NULL,
+            id TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (collection, id)
+        );
+    """
+
+    def __init__(self, path='exam.db'):
+        self.path = path
+        self.permanent_errors = (DocumentNotFound,)
+        self.applied_errors = (DocumentExists,)
+        self._local = threading.local()
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        # One connection per thread; WAL lets readers run alongside the writer
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def new_id(self, collection):
+        return uuid.uuid4().hex[:20]
+
+    def _read(self, conn, collection, doc_id):
+        if collection == 'students':
+            row = conn.execute('SELECT data FROM students WHERE id = ?', (doc_id,)).fetchone()
+        else:
+            row = conn.execute('SELECT data FROM documents WHERE collection = ? AND id = ?',
+                               (collection, doc_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write(self, conn, collection, doc_id, data):
+        if collection == 'students':
+            columns = [data.get(field) for field in self.STUDENT_COLUMNS.values()]
+            conn.execute(f"INSERT OR REPLACE INTO students (id, {', '.join(self.STUDENT_COLUMNS)}, data) "
+                         f"VALUES (?, {', '.join('?' * len(columns))}, ?)",
+                         [doc_id] + columns + [json.dumps(data)])
+        else:
+            conn.execute('INSERT OR REPLACE INTO documents (collection, id, data) VALUES (?, ?, ?)',
+                         (collection, doc_id, json.dumps(data)))
+
+    def get(self, collection, doc_id):
+        return self._read(self._conn(), collection, doc_id)
+
+    def commit(self, ops):
+        conn = self._conn()
+        with conn:  # One transaction: all operations are applied or none are
+            # Take the write lock before reading, so another process's commit
+            # cannot land between the read and the write of an increment
+            conn.execute('BEGIN IMMEDIATE')
+            for kind, collection, doc_id, data in ops:
+                current = self._read(conn, collection, doc_id)
+                if kind == 'set':
+                    current = dict(data)
+                elif kind == 'update':
+                    if current is None:
+                        raise DocumentNotFound(f'{collection}/{doc_id}')
+                    current.update(data)
+                elif kind == 'merge':
+                    current = current or {}
+                    _merge(current, data)
+                elif kind == 'create':
+                    if current is not None:
+                        raise DocumentExists(f'{collection}/{doc_id}')
+                    current = dict(data)
+                else:
+                    current = current or {}
+                    _increment(current, data)
+                self._write(conn, collection, doc_id, current)
+
+    def query_students(self, cursor=None, limit=50, sort='exam_date', order='desc', college=None,
+                       stream=None, min_score=None, max_score=None, fields=None):
+        """Fetch one page of students; returns ([(id, data), ...], next cursor or None).
+
+        Pages and cursors match FirestoreStorage.query_students.
+        """
+        # The sort fields are stored in columns of the same name
+        sort_column = SORT_FIELDS[sort] if sort else None
+        if min_score is not None or max_score is not None:
+            sort_column = SORT_FIELDS['score']
+        direction = 'ASC' if order == 'asc' else 'DESC'
+        after = '>' if order == 'asc' else '<'
+
+        where, params = [], []
+        if sort_column:
+            where.append(f'{sort_column} IS NOT NULL')  # Firestore leaves out documents without the field
+        if college:
+            where.append('college = ?')
+            params.append(college)
+        if stream:
+            where.append('stream = ?')
+            params.append(stream)
+        if min_score is not None:
+            where.append('normalized_score >= ?')
+            params.append(min_score)
+        if max_score is not None:
+            where.append('normalized_score <= ?')
+            params.append(max_score)
+        if cursor:
+            values = decode_cursor(cursor)
+            if sort_column:
+                where.append(f'({sort_column} {after} ? OR ({sort_column} = ? AND id {after} ?))')
+                params += [values[0], values[0], values[1]]
+            else:
+                where.append(f'id {after} ?')
+                params.append(values[0])
+
+        sql = 'SELECT id, data FROM students'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        order_by = [f'{sort_column} {direction}'] if sort_column else []
+        sql += f" ORDER BY {', '.join(order_by + [f'id {direction}'])} LIMIT ?"
+        rows = self._conn().execute(sql, params + [limit]).fetchall()
+
+        students = [(student_id, json.loads(data)) for student_id, data in rows]
+        next_cursor = None
+        if len(students) == limit:
+            last_id, last = students[-1]
+            next_cursor = encode_cursor([last.get(sort_column), last_id] if sort_column else [last_id])
+        return [(student_id, _project(data, fields)) for student_id, data in students], next_cursor
+
+    def stream_students(self, fields=None):
+        for student_id, data in self._conn().execute('SELECT id, data FROM students ORDER BY id'):
+            yield student_id, _project(json.loads(data), fields)
+
+    def rebuild_document(self, collection, doc_id, build, fields=None):
+        """Set a document to build(student dicts) in one transaction with reading the students."""
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')  # No commit can land while the students are read
+            rows = conn.execute('SELECT data FROM students ORDER BY id')
+            data = build(_project(json.loads(row[0]), fields) for row in rows)
+            self._write(conn, collection, doc_id, data)
+        return data
+
+    def stream_questions(self):
+        rows = self._conn().execute("SELECT id, data FROM documents WHERE collection = 'questions' ORDER BY id")
+        for question_id, data in rows:
+            data = json.loads(data)
+            data.setdefault('id', question_id)
+            yield data
+
+    def list_questions(self):
+        return list(self.stream_questions())
+
+    def questions_version(self):
+        # The database is local, so hash the questions themselves
+        digest = hashlib.sha1()
+        rows = self._conn().execute("SELECT id, data FROM documents WHERE collection = 'questions' ORDER BY id")
+        for question_id, data in rows:
+            digest.update(f'{question_id}\0{data}\n'.encode('utf-8'))
+        return digest.hexdigest()
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """Return the process-wide storage backend chosen by EXAM_STORAGE."""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            backend = os.environ.get('EXAM_STORAGE', 'firestore')
+            if backend == 'sqlite':
+                _storage = SQLiteStorage(os.environ.get('EXAM_SQLITE_PATH', 'exam.db'))
+            elif backend == 'firestore':
+                _storage = FirestoreStorage()
+            else:
+                raise ValueError(f'Unknown EXAM_STORAGE backend: {backend}')
+        return _storage
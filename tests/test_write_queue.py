@@ -0,0 +1,224 @@
+"""Crash, replay and concurrency tests for WriteBehindQueue.
+
+A crash is simulated by closing the journal without stop(), leaving it as a
+killed process would; a new queue on the same journal then replays it.
+"""
+import json
+import threading
+import time
+
+import pytest
+
+from score_stats import STATS_COLLECTION, STATS_DOCUMENT, increment_ops, login_increment
+from storage import SQLiteStorage
+from write_queue import WriteBehindQueue
+
+
+class Recorder:
+    """A commit function that records each commit and can be told to fail."""
+
+    def __init__(self, fail=None, delay=0):
+        self.commits = []
+        self.fail = fail      # called with the ops; returns an exception to raise, or None
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def __call__(self, ops):
+        if self.delay:
+            time.sleep(self.delay)
+        error = self.fail(ops) if self.fail else None
+        if error is not None:
+            raise error
+        with self.lock:
+            self.commits.append([op[2] for op in ops])
+
+    def committed(self):
+        return [doc_id for commit in self.commits for doc_id in commit]
+
+
+def op(doc_id):
+    return ('merge', 'students', doc_id, {'name': doc_id})
+
+
+def crash(queue):
+    queue._journal.close()
+
+
+def make_queue(commit_fn, journal, **kwargs):
+    kwargs.setdefault('window', 0)
+    return WriteBehindQueue(commit_fn, str(journal), **kwargs)
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return tmp_path / 'journal.log'
+
+
+def test_entries_are_committed_once_in_order(journal):
+    commit = Recorder()
+    queue = make_queue(commit, journal, max_batch=2)
+    for doc_id in 'abcde':
+        queue.enqueue([op(doc_id)])
+    while queue.pending_count():
+        assert queue.flush()
+    assert commit.commits == [['a', 'b'], ['c', 'd'], ['e']]
+    queue.stop()
+    assert journal.read_text() == ''
+
+
+def test_crash_mid_batch_replays_every_uncommitted_entry(journal):
+    commit = Recorder(fail=lambda ops: ConnectionError('connection reset'))
+    queue = make_queue(commit, journal)
+    queue.enqueue([op('a')])
+    queue.enqueue([op('b'), op('c')])
+    assert not queue.flush()
+    crash(queue)
+
+    commit = Recorder()
+    replayed = make_queue(commit, journal)
+    assert replayed.pending_count() == 3
+    assert replayed.flush()
+    assert commit.commits == [['a', 'b', 'c']]
+
+
+def test_crash_after_partial_progress_replays_only_the_rest(journal):
+    commit = Recorder()
+    queue = make_queue(commit, journal, max_batch=1)
+    for doc_id in 'abc':
+        queue.enqueue([op(doc_id)])
+    assert queue.flush()
+    crash(queue)
+
+    commit = Recorder()
+    replayed = make_queue(commit, journal)
+    replayed.flush()
+    assert commit.committed() == ['b', 'c']
+    # Sequence numbers carry on after the replayed entries
+    assert replayed.enqueue([op('d')]) == 4
+
+
+def test_torn_final_line_is_ignored(journal):
+    queue = make_queue(Recorder(fail=lambda ops: ConnectionError()), journal)
+    queue.enqueue([op('a')])
+    crash(queue)
+    with open(journal, 'a', encoding='utf-8') as f:
+        f.write('{"seq": 2, "ops": [["merge", "stu')
+
+    commit = Recorder()
+    replayed = make_queue(commit, journal)
+    replayed.flush()
+    assert commit.committed() == ['a']
+
+
+def test_commit_before_ack_is_not_applied_twice(journal, tmp_path):
+    storage = SQLiteStorage(str(tmp_path / 'exam.db'))
+    queue = make_queue(storage.commit, journal, permanent_errors=storage.permanent_errors,
+                       applied_errors=storage.applied_errors)
+    queue.enqueue([op('a'), *increment_ops(login_increment())])
+    queue.enqueue([op('b'), *increment_ops(login_increment())])
+    # The batch reaches storage, then the process dies before acknowledging it
+    storage.commit([tuple(o) for entry in queue._queue for o in entry['ops']])
+    crash(queue)
+
+    replayed = make_queue(storage.commit, journal, permanent_errors=storage.permanent_errors,
+                          applied_errors=storage.applied_errors)
+    assert replayed.pending_count() == 6
+    assert replayed.flush()
+    assert replayed.pending_count() == 0
+    assert storage.get(STATS_COLLECTION, STATS_DOCUMENT)['count'] == 2
+
+
+def test_commit_that_times_out_after_landing_is_not_applied_twice(journal, tmp_path):
+    storage = SQLiteStorage(str(tmp_path / 'exam.db'))
+    timed_out = []
+
+    def commit(ops):
+        storage.commit(ops)
+        if not timed_out:
+            timed_out.append(True)
+            raise TimeoutError('deadline exceeded')
+
+    queue = make_queue(commit, journal, permanent_errors=storage.permanent_errors,
+                       applied_errors=storage.applied_errors)
+    queue.enqueue([op('a'), *increment_ops(login_increment())])
+    assert not queue.flush()
+    assert queue.flush()
+    assert storage.get(STATS_COLLECTION, STATS_DOCUMENT)['count'] == 1
+
+
+def test_permanent_error_is_dead_lettered_without_blocking_the_queue(journal):
+    commit = Recorder(fail=lambda ops: KeyError('missing') if any(o[2] == 'bad' for o in ops) else None)
+    queue = make_queue(commit, journal, permanent_errors=(KeyError,))
+    for doc_id in ('a', 'bad', 'c'):
+        queue.enqueue([op(doc_id)])
+    assert queue.flush()
+    assert commit.committed() == ['a', 'c']
+    assert queue.pending_count() == 0
+    failed = [json.loads(line) for line in open(f'{journal}.failed', encoding='utf-8')]
+    assert [record['entry']['ops'][0][2] for record in failed] == ['bad']
+
+
+def test_compaction_keeps_only_uncommitted_entries(journal):
+    commit = Recorder()
+    queue = make_queue(commit, journal, max_batch=1)
+    queue.MAX_JOURNAL_BYTES = 1
+    for doc_id in 'abc':
+        queue.enqueue([op(doc_id)])
+    assert queue.flush()
+    entries = [json.loads(line) for line in open(journal, encoding='utf-8')]
+    assert [entry['ops'][0][2] for entry in entries] == ['b', 'c']
+    crash(queue)
+
+    commit = Recorder()
+    make_queue(commit, journal).flush()
+    assert commit.committed() == ['b', 'c']
+
+
+def test_concurrent_enqueue_flush_and_stop(journal):
+    commit = Recorder(delay=0.002)
+    queue = make_queue(commit, journal, window=0.01, max_batch=50)
+    queue.start()
+
+    def enqueue(worker):
+        for i in range(200):
+            queue.enqueue([op(f'{worker}-{i}')])
+
+    def flush():
+        for _ in range(50):
+            queue.flush()
+
+    threads = [threading.Thread(target=enqueue, args=(worker,)) for worker in range(8)]
+    threads += [threading.Thread(target=flush) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    queue.stop(timeout=30)
+
+    committed = commit.committed()
+    assert len(committed) == len(set(committed)) == 8 * 200
+    assert queue.pending_count() == 0
+    assert journal.read_text() == ''
+
+
+def test_stop_waits_for_the_batch_in_flight(journal):
+    started = threading.Event()
+    release = threading.Event()
+
+    def fail(ops):
+        started.set()
+        release.wait()
+
+    commit = Recorder(fail=fail)
+    queue = make_queue(commit, journal)
+    queue.start()
+    queue.enqueue([op('a'), op('b')])
+    assert started.wait(5)
+    stopper = threading.Thread(target=queue.stop, kwargs={'timeout': 10})
+    stopper.start()
+    time.sleep(0.05)
+    release.set()
+    stopper.join()
+    # The flusher's batch was committed once; stop() did not commit it again
+    assert commit.commits == [['a', 'b']]
+    assert queue.pending_count() == 0
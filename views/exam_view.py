@@ -1,30 +1,45 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
-                             QPushButton, QFrame, QRadioButton, QButtonGroup,
-                             QScrollArea, QMessageBox)
-from PyQt6.QtCore import Qt, QTimer, QEvent
+                             QPushButton, QFrame, QListView,
+                             QAbstractItemView, QMessageBox)
+from PyQt6.QtCore import Qt, QTimer, QEvent, pyqtSignal
 from PyQt6.QtGui import QFont
-import firebase_admin
-from firebase_admin import firestore
+from datetime import datetime
+import threading
+from storage import get_storage
+from controllers.storage_provider import storage_provider
+from views.question_loader import QuestionLoader
+from views.question_model import QuestionModel, QuestionDelegate
+from views.responsive import apply_breakpoint, is_compact
 import json
 
+AUTOSAVE_INTERVAL = 30  # seconds
+
 class ExamView(QWidget):
+    # Rows whose autosave failed, sent back from the autosave thread
+    autosave_failed = pyqtSignal(set)
+    
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.compact = None  # Layout breakpoint currently applied
         self.setup_ui()
         
-        # Initialize Firebase
-        try:
-            self.db = firestore.client()
-        except Exception as e:
-            print(f"Firebase initialization error: {str(e)}")
-            self.db = None
-            
         # Initialize timer
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_timer)
         self.remaining_time = 7200  # 2 hours in seconds
         self.timer.start(1000)  # Update every second
         
+        # Periodically save the answers changed since the last autosave
+        self.autosave_failed.connect(self.question_model.answer_store.restore_changes)
+        self.autosave_timer = QTimer()
+        self.autosave_timer.timeout.connect(self.autosave)
+        self.autosave_timer.start(AUTOSAVE_INTERVAL * 1000)
+        
+    @property
+    def db(self):
+        """Shared storage (Firebase, or SQLite when EXAM_STORAGE=sqlite); None while connecting."""
+        return storage_provider().storage()
+        
     def setup_ui(self):
         """Setup the exam view UI."""
         # Create main layout
@@ -50,76 +65,38 @@ class ExamView(QWidget):
         
         main_layout.addWidget(header)
         
-        # Add scroll area for questions
-        scroll = QScrollArea()
-        scroll.setWidgetResizable(True)
-        scroll.setObjectName("questionScroll")
-        
-        # Create container for questions
-        self.question_container = QWidget()
-        self.question_layout = QVBoxLayout(self.question_container)
-        self.question_layout.setSpacing(20)
-        
-        scroll.setWidget(self.question_container)
-        main_layout.addWidget(scroll)
+        # Add question list; questions are painted by QuestionDelegate, so only
+        # the ones on screen cost anything and no widgets exist per question
+        self.question_model = QuestionModel(self)
+        self.question_list = QListView()
+        self.question_list.setObjectName("questionList")
+        self.question_list.setModel(self.question_model)
+        self.question_list.setItemDelegate(QuestionDelegate(self.question_list))
+        self.question_list.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.question_list.setSelectionMode(QAbstractItemView.SelectionMode.NoSelection)
+        self.question_list.setResizeMode(QListView.ResizeMode.Adjust)
+        self.question_list.setLayoutMode(QListView.LayoutMode.Batched)
+        self.question_list.setBatchSize(50)
+        main_layout.addWidget(self.question_list)
         
         # Load questions
         self.load_questions()
         
     def load_questions(self):
-        """Load questions from Firebase."""
-        try:
-            # Get questions from Firebase
-            questions_ref = self.db.collection('questions')
-            questions = questions_ref.stream()
-            
-            # Clear existing questions
-            while self.question_layout.count():
-                item = self.question_layout.takeAt(0)
-                if item.widget():
-                    item.widget().deleteLater()
-            
-            # Add questions to layout
-            for question in questions:
-                data = question.to_dict()
-                self.add_question(data)
-                
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load questions: {str(e)}")
+        """Load questions from storage (or the local cache) in the background."""
+        self.question_model.set_questions([])
+        
+        # Questions are appended batch by batch as the loader thread delivers them;
+        # the loader connects through get_storage(), sharing the provider's connection
+        self.question_loader = QuestionLoader(get_storage, parent=self)
+        self.question_loader.batch_loaded.connect(self.question_model.append_questions)
+        self.question_loader.loading_failed.connect(self.handle_load_failed)
+        self.question_loader.start()
+        
+    def handle_load_failed(self, error):
+        """Report a failed question download."""
+        QMessageBox.critical(self, "Error", f"Failed to load questions: {error}")
             
-    def add_question(self, data):
-        """Add a question to the layout."""
-        # Create question frame
-        question_frame = QFrame()
-        question_frame.setObjectName("questionFrame")
-        question_layout = QVBoxLayout(question_frame)
-        
-        # Add question text
-        question_text = QLabel(data.get('question', ''))
-        question_text.setObjectName("questionText")
-        question_text.setWordWrap(True)
-        question_layout.addWidget(question_text)
-        
-        # Create button group for options
-        button_group = QButtonGroup(self)
-        
-        # Add options
-        options = ['A', 'B', 'C', 'D']
-        for option in options:
-            option_text = data.get(f'option_{option}', '')
-            if option_text:
-                radio = QRadioButton(option_text)
-                radio.setObjectName(f"option_{option}")
-                radio.setProperty("option", option)
-                button_group.addButton(radio)
-                question_layout.addWidget(radio)
-        
-        # Store question data
-        question_frame.setProperty("question_id", data.get('id'))
-        question_frame.setProperty("correct_answer", data.get('correct_answer'))
-        
-        self.question_layout.addWidget(question_frame)
-        
     def update_timer(self):
         """Update the timer display."""
         if self.remaining_time > 0:
@@ -133,30 +110,57 @@ class ExamView(QWidget):
             self.timer.stop()
             self.handle_submit()
             
+    def student_id(self):
+        """The logged-in student's id, if any."""
+        if hasattr(self.parent(), 'session'):
+            return self.parent().session.get('student_id')
+        return None
+        
+    def autosave(self):
+        """Save the answers changed since the last autosave, off the GUI thread."""
+        student_id = self.student_id()
+        db = self.db
+        if not student_id or db is None:
+            return
+        rows, changes = self.question_model.answer_store.take_changes()
+        if not changes:
+            return
+        op = ('merge', 'submissions', student_id, {'autosave': {
+            'answers': changes,
+            'time_remaining': self.remaining_time,
+            'saved_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }})
+        threading.Thread(target=self.write_autosave, args=(db, op, rows), daemon=True).start()
+        
+    def write_autosave(self, db, op, rows):
+        try:
+            db.commit([op])
+        except Exception as e:
+            print(f"Autosave error: {str(e)}")
+            self.autosave_failed.emit(rows)
+            
     def handle_submit(self):
         """Handle exam submission."""
         try:
             # Collect answers
-            answers = {}
-            for i in range(self.question_layout.count()):
-                question_frame = self.question_layout.itemAt(i).widget()
-                question_id = question_frame.property("question_id")
-                
-                # Find selected option
-                for radio in question_frame.findChildren(QRadioButton):
-                    if radio.isChecked():
-                        answers[question_id] = radio.property("option")
-                        break
+            answers = self.question_model.answer_store.answers()
             
-            # Store answers in Firebase
-            if hasattr(self.parent(), 'session') and 'student_id' in self.parent().session:
-                student_id = self.parent().session['student_id']
-                submission_ref = self.db.collection('submissions').document(student_id)
-                submission_ref.set({
+            # Store answers
+            student_id = self.student_id()
+            if student_id:
+                if self.db is None:
+                    error = storage_provider().error
+                    if error:
+                        self.window().handle_storage_failed(error)
+                    else:
+                        QMessageBox.warning(self, "Please Wait", "Still connecting to the exam server, please try again in a moment")
+                    return
+                self.autosave_timer.stop()
+                self.db.commit([('set', 'submissions', student_id, {
                     'answers': answers,
-                    'submission_time': firestore.SERVER_TIMESTAMP,
+                    'submission_time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                     'exam_completed': True
-                })
+                })])
                 
                 # Show success message
                 QMessageBox.information(self, "Success", "Exam submitted successfully!")
@@ -208,47 +212,21 @@ class ExamView(QWidget):
         return super().eventFilter(obj, event)
             
     def adjust_responsive_layout(self):
-        """Adjust layout based on screen size."""
-        # Get screen size
-        screen = self.screen()
-        if screen:
-            size = screen.size()
-            width = size.width()
-            
-            # Adjust for mobile screens
-            if width < 768:
-                # Adjust margins
-                self.layout().setContentsMargins(10, 10, 10, 10)
-                
-                # Adjust font sizes
-                self.adjust_fonts()
-            else:
-                # Reset margins
-                self.layout().setContentsMargins(20, 20, 20, 20)
+        """Switch layouts when the view's width crosses the compact breakpoint."""
+        compact = is_compact(self)
+        if compact == self.compact:
+            return
+        self.compact = compact
+        
+        # Adjust margins
+        margin = 10 if compact else 20
+        self.layout().setContentsMargins(margin, margin, margin, margin)
+        
+        # Adjust font sizes
+        self.adjust_fonts()
                 
     def adjust_fonts(self):
-        """Adjust font sizes based on screen size."""
-        screen = self.screen()
-        if screen:
-            width = screen.size().width()
-            
-            # Base font size
-            base_size = 12 if width < 768 else 14
-            
-            # Adjust labels
-            for label in self.findChildren(QLabel):
-                font = label.font()
-                font.setPointSize(base_size)
-                label.setFont(font)
-                
-            # Adjust radio buttons
-            for radio in self.findChildren(QRadioButton):
-                font = radio.font()
-                font.setPointSize(base_size)
-                radio.setFont(font)
-                
-            # Adjust buttons
-            for button in self.findChildren(QPushButton):
-                font = button.font()
-                font.setPointSize(base_size)
-                button.setFont(font) 
\ No newline at end of file
+        """Apply the current breakpoint's font sizes with one stylesheet change."""
+        apply_breakpoint(self, self.compact)
+        # Question heights depend on the font; lay the list out again
+        self.question_list.doItemsLayout()
@@ -4,26 +4,23 @@ from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
 from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtGui import QFont, QIcon
 from datetime import datetime
-import firebase_admin
-from firebase_admin import credentials, firestore
+from controllers.storage_provider import storage_provider
+from views.responsive import apply_breakpoint, is_compact
 
 class LoginView(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.compact = None  # Layout breakpoint currently applied
         self.setup_ui()
         
-        # Initialize Firebase
-        try:
-            cred = credentials.Certificate('serviceAccountKey.json')
-            firebase_admin.initialize_app(cred)
-            self.db = firestore.client()
-        except Exception as e:
-            print(f"Firebase initialization error: {str(e)}")
-            self.db = None
-            
         # Initialize session
         self.session = {}
         
+    @property
+    def db(self):
+        """Shared storage (Firebase, or SQLite when EXAM_STORAGE=sqlite); None while connecting."""
+        return storage_provider().storage()
+        
     def setup_ui(self):
         """Setup the login view UI."""
         # Create main layout
@@ -113,10 +110,10 @@ class LoginView(QWidget):
         form_layout.addWidget(self.address_input)
         
         # Add submit button
-        submit_btn = QPushButton("Begin Examination")
-        submit_btn.setObjectName("submitBtn")
-        submit_btn.clicked.connect(self.handle_submit)
-        form_layout.addWidget(submit_btn)
+        self.submit_btn = QPushButton("Begin Examination")
+        self.submit_btn.setObjectName("submitBtn")
+        self.submit_btn.clicked.connect(self.handle_submit)
+        form_layout.addWidget(self.submit_btn)
         
         login_layout.addWidget(form)
         
@@ -171,11 +168,17 @@ class LoginView(QWidget):
                 'exam_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             }
             
-            # Store data in Firebase
+            # Store student data
+            if self.db is None:
+                error = storage_provider().error
+                if error:
+                    self.window().handle_storage_failed(error)
+                else:
+                    QMessageBox.warning(self, "Please Wait", "Still connecting to the exam server, please try again in a moment")
+                return
             try:
-                student_ref = self.db.collection('students').document()
-                student_id = student_ref.id
-                student_ref.set(student_data)
+                student_id = self.db.new_id('students')
+                self.db.commit([('set', 'students', student_id, student_data)])
                 
                 # Store student_id in session
                 self.session['student_id'] = student_id
@@ -193,58 +196,24 @@ class LoginView(QWidget):
             QMessageBox.critical(self, "Error", f"An error occurred: {str(e)}")
             
     def adjust_responsive_layout(self):
-        """Adjust layout based on screen size."""
-        # Get screen size
-        screen = self.screen()
-        if screen:
-            size = screen.size()
-            width = size.width()
-            height = size.height()
-            
-            # Adjust for mobile screens
-            if width < 768:
+        """Switch layouts when the view's width crosses the compact breakpoint."""
+        compact = is_compact(self)
+        if compact == self.compact:
+            return
+        self.compact = compact
+        
+        layout = self.layout()
+        if layout:
+            if compact:
                 # Stack banner and login vertically
-                layout = self.layout()
-                if layout:
-                    layout.setDirection(QVBoxLayout.Direction.TopToBottom)
-                    
-                # Adjust form field sizes
-                for widget in self.findChildren(QLineEdit):
-                    widget.setFixedWidth(int(width * 0.8))
-                for widget in self.findChildren(QTextEdit):
-                    widget.setFixedWidth(int(width * 0.8))
-                    
-                # Adjust font sizes
-                self.adjust_fonts()
+                layout.setDirection(QVBoxLayout.Direction.TopToBottom)
             else:
                 # Side by side layout
-                layout = self.layout()
-                if layout:
-                    layout.setDirection(QHBoxLayout.Direction.LeftToRight)
+                layout.setDirection(QHBoxLayout.Direction.LeftToRight)
+                
+        # Adjust font sizes
+        self.adjust_fonts()
                     
     def adjust_fonts(self):
-        """Adjust font sizes based on screen size."""
-        screen = self.screen()
-        if screen:
-            width = screen.size().width()
-            
-            # Base font size
-            base_size = 12 if width < 768 else 14
-            
-            # Adjust labels
-            for label in self.findChildren(QLabel):
-                font = label.font()
-                font.setPointSize(base_size)
-                label.setFont(font)
-                
-            # Adjust input fields
-            for input_field in self.findChildren((QLineEdit, QTextEdit)):
-                font = input_field.font()
-                font.setPointSize(base_size)
-                input_field.setFont(font)
-                
-            # Adjust button
-            for button in self.findChildren(QPushButton):
-                font = button.font()
-                font.setPointSize(base_size)
-                button.setFont(font) 
\ No newline at end of file
+        """Apply the current breakpoint's font sizes with one stylesheet change."""
+        apply_breakpoint(self, self.compact)
@@ -0,0 +1,84 @@
+import json
+import os
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+QUESTION_CACHE_FILE = 'question_cache.json'
+BATCH_SIZE = 25
+
+
+def read_cache(path=QUESTION_CACHE_FILE):
+    """(version, questions) of the last fetched bank, or (None, None)."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            cache = json.load(f)
+        return cache['version'], cache['questions']
+    except (OSError, ValueError, KeyError):
+        return None, None
+
+
+def write_cache(version, questions, path=QUESTION_CACHE_FILE):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': version, 'questions': questions}, f, default=str)
+    os.replace(tmp_path, path)
+
+
+class QuestionLoader(QThread):
+    """Fetches the question bank off the GUI thread, in batches.
+
+    The bank is streamed from storage and handed to the view BATCH_SIZE
+    questions at a time through `batch_loaded`, so the first questions show
+    while the rest arrive. The fetched bank is cached on disk together with
+    the storage's questions_version(); while that has not changed the cache
+    is used and the questions are not fetched again. If storage cannot be
+    reached the cached bank is used as it is.
+    """
+
+    batch_loaded = pyqtSignal(list)   # question documents
+    loading_finished = pyqtSignal(int)  # number of questions
+    loading_failed = pyqtSignal(str)
+
+    def __init__(self, storage_fn, cache_path=QUESTION_CACHE_FILE, parent=None):
+        super().__init__(parent)
+        self.storage_fn = storage_fn  # called on the loader thread
+        self.cache_path = cache_path
+
+    def _emit_batches(self, questions):
+        for start in range(0, len(questions), BATCH_SIZE):
+            self.batch_loaded.emit(questions[start:start + BATCH_SIZE])
+
+    def run(self):
+        cached_version, cached = read_cache(self.cache_path)
+        questions = []
+        try:
+            storage = self.storage_fn()
+            version = storage.questions_version()
+            if cached is not None and version == cached_version:
+                self._emit_batches(cached)
+                self.loading_finished.emit(len(cached))
+                return
+
+            batch = []
+            for data in storage.stream_questions():
+                questions.append(data)
+                batch.append(data)
+                if len(batch) == BATCH_SIZE:
+                    self.batch_loaded.emit(batch)
+                    batch = []
+            if batch:
+                self.batch_loaded.emit(batch)
+        except Exception as e:
+            if cached is not None and not questions:
+                # Offline: fall back to the last bank that was fetched
+                self._emit_batches(cached)
+                self.loading_finished.emit(len(cached))
+            else:
+                self.loading_failed.emit(str(e))
+            return
+
+        try:
+            write_cache(version, questions, self.cache_path)
+        except OSError as e:
+            print(f"Error writing question cache: {str(e)}")
+        self.loading_finished.emit(len(questions))
@@ -0,0 +1,226 @@
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QRect, QRectF, QSize, QEvent
+from PyQt6.QtWidgets import QStyledItemDelegate
+from PyQt6.QtGui import QColor, QFont, QFontMetrics, QPainter, QPen
+
+OPTIONS = ('A', 'B', 'C', 'D')
+
+QuestionIdRole = Qt.ItemDataRole.UserRole + 1
+OptionsRole = Qt.ItemDataRole.UserRole + 2
+AnswerRole = Qt.ItemDataRole.UserRole + 3
+
+# drawText/boundingRect flags, as ints so text and alignment flags can be combined
+WRAP = Qt.TextFlag.TextWordWrap.value
+WRAP_CENTERED = WRAP | Qt.AlignmentFlag.AlignVCenter.value
+
+
+def question_record(data):
+    """(question id, question text, ((letter, option text), ...)) from a question document."""
+    options = tuple((option, data.get(f'option_{option}', '')) for option in OPTIONS
+                    if data.get(f'option_{option}', ''))
+    return data.get('id'), data.get('question', ''), options
+
+
+class AnswerStore:
+    """The candidate's answers, indexed by question position.
+
+    One byte per question (0 = unanswered, 1-4 = A-D) plus the positions
+    changed since the last autosave, so submitting and autosaving serialize
+    this directly instead of asking any widget.
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.codes = bytearray()
+        self._changed = set()
+
+    def __len__(self):
+        return len(self.codes)
+
+    def clear(self):
+        self.ids = []
+        self.codes = bytearray()
+        self._changed = set()
+
+    def extend(self, question_ids):
+        self.ids.extend(question_ids)
+        self.codes.extend(bytes(len(question_ids)))
+
+    def get(self, row):
+        code = self.codes[row]
+        return OPTIONS[code - 1] if code else None
+
+    def set(self, row, option):
+        code = OPTIONS.index(option) + 1 if option else 0
+        if self.codes[row] != code:
+            self.codes[row] = code
+            self._changed.add(row)
+
+    def answers(self):
+        """Answered questions as {question id: option letter}."""
+        return {self.ids[row]: OPTIONS[code - 1] for row, code in enumerate(self.codes) if code}
+
+    def take_changes(self):
+        """(rows, {question id: option letter or None}) changed since the last call."""
+        rows, self._changed = self._changed, set()
+        return rows, {self.ids[row]: self.get(row) for row in rows}
+
+    def restore_changes(self, rows):
+        """Mark rows as changed again, after their autosave failed."""
+        self._changed.update(rows)
+
+
+class QuestionModel(QAbstractListModel):
+    """The questions of the paper, with the candidate's answers in an AnswerStore.
+
+    One row per question; no widgets are created per question.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._questions = []
+        self.answer_store = AnswerStore()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._questions)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        question_id, text, options = self._questions[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return text
+        if role == QuestionIdRole:
+            return question_id
+        if role == OptionsRole:
+            return options
+        if role == AnswerRole:
+            return self.answer_store.get(index.row())
+        return None
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if role != AnswerRole or not index.isValid():
+            return False
+        self.answer_store.set(index.row(), value)
+        self.dataChanged.emit(index, index, [AnswerRole])
+        return True
+
+    def set_questions(self, questions):
+        """Replace the paper with question documents; clears the answers."""
+        self.beginResetModel()
+        self._questions = [question_record(data) for data in questions]
+        self.answer_store.clear()
+        self.answer_store.extend([question_id for question_id, _, _ in self._questions])
+        self.endResetModel()
+
+    def append_questions(self, questions):
+        """Add question documents at the end, e.g. as they stream in."""
+        if not questions:
+            return
+        first = len(self._questions)
+        self.beginInsertRows(QModelIndex(), first, first + len(questions) - 1)
+        records = [question_record(data) for data in questions]
+        self._questions.extend(records)
+        self.answer_store.extend([question_id for question_id, _, _ in records])
+        self.endInsertRows()
+
+
+class QuestionDelegate(QStyledItemDelegate):
+    """Paints a question card (text plus option radios) for each visible row.
+
+    Only the rows on screen are painted, and clicks are mapped to an option
+    from the same geometry, so the view needs no child widgets at all.
+    Heights are cached per row until the width or font changes.
+    """
+
+    MARGIN = 20
+    SPACING = 10
+    INDICATOR = 18
+    ACCENT = QColor('#8B4513')
+    BORDER = QColor('#ddd')
+
+    def __init__(self, view):
+        super().__init__(view)
+        self.view = view
+        self._heights = {}
+        self._heights_key = None
+        view.model().modelReset.connect(self._heights.clear)
+
+    def _question_font(self, option):
+        font = QFont(option.font)
+        font.setBold(True)
+        if font.pixelSize() > 0:
+            font.setPixelSize(font.pixelSize() + 2)
+        else:
+            font.setPointSizeF(font.pointSizeF() + 1.5)
+        return font
+
+    def _layout(self, option, index, width):
+        """Question text rect, [(letter, text, hit rect, indicator rect, text rect)] and height."""
+        inner = width - 2 * self.MARGIN
+        left = self.MARGIN
+        question_metrics = QFontMetrics(self._question_font(option))
+        text_height = question_metrics.boundingRect(QRect(0, 0, inner, 100000), WRAP, index.data()).height()
+        text_rect = QRect(left, self.MARGIN, inner, text_height)
+
+        y = text_rect.bottom() + self.SPACING + 5
+        label_left = left + self.INDICATOR + self.SPACING
+        label_width = inner - self.INDICATOR - self.SPACING
+        options = []
+        for letter, label in index.data(OptionsRole):
+            label_height = option.fontMetrics.boundingRect(QRect(0, 0, label_width, 100000), WRAP, label).height()
+            row_height = max(self.INDICATOR, label_height) + self.SPACING
+            indicator = QRect(left, y + (row_height - self.INDICATOR) // 2, self.INDICATOR, self.INDICATOR)
+            options.append((letter, label, QRect(left, y, inner, row_height), indicator,
+                            QRect(label_left, y, label_width, row_height)))
+            y += row_height
+        return text_rect, options, y + self.MARGIN
+
+    def sizeHint(self, option, index):
+        width = self.view.viewport().width()
+        key = (width, option.fontMetrics.height())
+        if key != self._heights_key:
+            self._heights.clear()
+            self._heights_key = key
+        height = self._heights.get(index.row())
+        if height is None:
+            height = self._heights[index.row()] = self._layout(option, index, width)[2] + self.SPACING
+        return QSize(width, height)
+
+    def paint(self, painter, option, index):
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        rect = option.rect
+        text_rect, options, height = self._layout(option, index, rect.width())
+
+        # White card, offset into the row
+        painter.translate(rect.left(), rect.top())
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(QColor('white'))
+        painter.drawRoundedRect(QRectF(0, 0, rect.width(), height), 5, 5)
+
+        painter.setPen(option.palette.text().color())
+        painter.setFont(self._question_font(option))
+        painter.drawText(text_rect, WRAP, index.data())
+
+        painter.setFont(option.font)
+        answer = index.data(AnswerRole)
+        for letter, label, _, indicator, label_rect in options:
+            checked = letter == answer
+            painter.setPen(QPen(self.ACCENT if checked else self.BORDER, 2))
+            painter.setBrush(self.ACCENT if checked else QColor('white'))
+            painter.drawEllipse(indicator)
+            painter.setPen(option.palette.text().color())
+            painter.drawText(label_rect, WRAP_CENTERED, label)
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        # A click on an option's row selects it, like a radio button
+        if event.type() == QEvent.Type.MouseButtonRelease and event.button() == Qt.MouseButton.LeftButton:
+            rect = option.rect
+            _, options, _ = self._layout(option, index, rect.width())
+            point = event.position().toPoint() - rect.topLeft()
+            for letter, _, hit, _, _ in options:
+                if hit.contains(point):
+                    model.setData(index, letter, AnswerRole)
+                    return True
+        return super().editorEvent(event, model, option, index)
@@ -0,0 +1,31 @@
+# MainWindow keeps windows at least 1200px wide, so the breakpoint sits above
+# that: views narrower than this (maximized on 1280px-wide laptop screens and
+# smaller) use the compact layout
+COMPACT_WIDTH = 1300
+REGULAR_STYLE_FILE = 'styles/regular.qss'
+COMPACT_STYLE_FILE = 'styles/compact.qss'
+
+_styles = {}
+
+
+def is_compact(widget):
+    """Whether the view itself is narrower than the compact breakpoint."""
+    return widget.width() < COMPACT_WIDTH
+
+
+def breakpoint_style(compact):
+    """The stylesheet for one side of the breakpoint, read once."""
+    path = COMPACT_STYLE_FILE if compact else REGULAR_STYLE_FILE
+    if path not in _styles:
+        try:
+            with open(path, encoding='utf-8') as f:
+                _styles[path] = f.read()
+        except OSError as e:
+            print(f"Error reading stylesheet {path}: {str(e)}")
+            _styles[path] = ''
+    return _styles[path]
+
+
+def apply_breakpoint(view, compact):
+    """Switch a view's fonts with a single stylesheet change."""
+    view.setStyleSheet(breakpoint_style(compact))
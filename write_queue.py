@@ -0,0 +1,324 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+MAX_BATCH_WRITES = 500  # Firestore limit on operations per batch commit
+
+log = logging.getLogger(__name__)
+
+
+def claim_journal(path, slots=256):
+    """Pick a journal of its own for one of several processes sharing `path`.
+
+    Returns (journal path, lock file) for the first of `path`.0, `path`.1, ...
+    that no running process holds. Keep the lock file open for as long as the
+    journal is in use; a process that replaces a dead one takes over its slot
+    and replays whatever it left unsaved.
+    """
+    import fcntl
+
+    for slot in range(slots):
+        lock = open(f'{path}.{slot}.lock', 'w')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            continue
+        return f'{path}.{slot}', lock
+    raise RuntimeError(f'All {slots} journal slots for {path} are in use')
+
+
+class WriteBehindQueue:
+    """Write-behind queue for Firestore writes, backed by an append-only journal.
+
+    Callers enqueue a list of write operations, each a (kind, collection,
+    document id, data) tuple with kind one of 'set', 'update', 'merge',
+    'increment' (data holds numeric deltas) or 'create'.
+    The operations are appended to the journal and fsync'ed before enqueue()
+    returns, so the request can be acknowledged without waiting for
+    Firestore; concurrent enqueues share one fsync (group commit), taken
+    outside every lock. A background thread groups queued entries into
+    batch commits of up to MAX_BATCH_WRITES operations, waiting up to
+    `window` seconds to fill a batch, and retries failed commits with
+    exponential backoff. Only one batch is ever in flight, and exactly the
+    entries that were committed are acknowledged.
+
+    Entries that were journaled but never committed (shutdown, crash or a
+    Firestore outage) are replayed from the journal on the next start.
+    Delivery is therefore at least once: an entry whose commit landed just
+    before a crash, or whose commit timed out after succeeding, is committed
+    again. An entry that must not be applied twice includes a 'create' of a
+    marker document; its second delivery fails with one of `applied_errors`
+    and is acknowledged without being applied. An entry rejected with one of
+    `permanent_errors` is moved to `<journal>.failed` instead of blocking the
+    queue.
+    """
+
+    MAX_JOURNAL_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, commit_fn, journal_path, window=0.5, max_batch=MAX_BATCH_WRITES,
+                 max_backoff=30.0, permanent_errors=(), applied_errors=(), fsync=True):
+        self.commit_fn = commit_fn    # called with a list of operations, commits them atomically
+        self.journal_path = journal_path
+        self.window = window
+        self.max_batch = max_batch
+        self.max_backoff = max_backoff
+        self.permanent_errors = tuple(permanent_errors)
+        self.applied_errors = tuple(applied_errors)
+        self.fsync = fsync
+
+        self._cond = threading.Condition()      # guards the queue; never held during I/O
+        self._journal_lock = threading.Lock()   # guards journal writes; taken before _cond
+        self._sync_lock = threading.Lock()
+        self._flush_lock = threading.Lock()     # held by whoever has the batch in flight
+        self._written = 0                       # records written to the journal
+        self._synced = 0                        # records known to be on disk
+        self._queue = deque()
+        self._pending_ops = 0
+        self._next_seq = 1
+        self._stopping = False
+        self._stopped = False
+        self._close_pending = False             # close the journal when the batch in flight is done
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self._replay()
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def _replay(self):
+        if not os.path.exists(self.journal_path):
+            return
+        entries = {}
+        with open(self.journal_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # Torn final line from a crash mid-append
+                if 'ack' in record:
+                    for seq in [s for s in entries if s <= record['ack']]:
+                        del entries[seq]
+                else:
+                    entries[record['seq']] = record
+                    self._next_seq = max(self._next_seq, record['seq'] + 1)
+        for seq in sorted(entries):
+            self._queue.append(entries[seq])
+            self._pending_ops += len(entries[seq]['ops'])
+        # Rewrite the journal with just the replayed entries
+        with open(self.journal_path, 'w', encoding='utf-8') as f:
+            for entry in self._queue:
+                f.write(json.dumps(entry) + '\n')
+        if self._queue:
+            log.warning('Replaying unsaved writes', extra={'writes': len(self._queue), 'journal': self.journal_path})
+
+    def _append(self, record):
+        # Called with _journal_lock held; returns the record's position for _sync()
+        self._journal.write(json.dumps(record) + '\n')
+        self._journal.flush()
+        self._written += 1
+        return self._written
+
+    def _sync(self, position):
+        """fsync the journal up to `position`, unless another thread's fsync already did."""
+        if not self.fsync:
+            return
+        with self._sync_lock:
+            if self._synced >= position:
+                return
+            with self._journal_lock:
+                target = self._written
+                # A duplicate descriptor stays valid if the journal is compacted meanwhile
+                fd = None if self._journal.closed else os.dup(self._journal.fileno())
+            if fd is not None:
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            self._synced = target
+
+    def enqueue(self, ops):
+        """Journal a group of operations that must be committed together."""
+        with self._journal_lock:
+            entry = {'seq': self._next_seq, 'ops': [list(op) for op in ops]}
+            self._next_seq += 1
+            position = self._append(entry)
+            with self._cond:
+                self._queue.append(entry)
+                self._pending_ops += len(entry['ops'])
+                self._cond.notify()
+        self._sync(position)
+        return entry['seq']
+
+    def pending_count(self):
+        """Number of journaled operations not yet committed."""
+        return self._pending_ops
+
+    def _take_batch(self):
+        entries = []
+        ops = 0
+        for entry in self._queue:
+            if entries and ops + len(entry['ops']) > self.max_batch:
+                break
+            entries.append(entry)
+            ops += len(entry['ops'])
+        return entries
+
+    def _ack(self, entries):
+        """Remove exactly `entries`, which were committed, from the queue and the journal."""
+        with self._journal_lock:
+            with self._cond:
+                # Only the flush-lock holder removes entries, so these are the head of the queue
+                for entry in entries:
+                    if self._queue and self._queue[0] is entry:
+                        self._queue.popleft()
+                    else:
+                        self._queue.remove(entry)
+                    self._pending_ops -= len(entry['ops'])
+                empty = not self._queue
+            if not empty:
+                self._append({'ack': entries[-1]['seq']})
+                if self._journal.tell() > self.MAX_JOURNAL_BYTES:
+                    self._compact()
+            else:
+                # Everything is committed (anything enqueued since would be queued
+                # already, as enqueue holds the journal lock); start the journal afresh
+                self._journal.truncate(0)
+                self._journal.seek(0)
+
+    def _compact(self):
+        # Called with the journal lock held: rewrite the journal with only the uncommitted entries
+        with self._cond:
+            queued = list(self._queue)
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in queued:
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal.close()
+        os.replace(tmp_path, self.journal_path)
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def _dead_letter(self, entry, error):
+        with open(self.journal_path + '.failed', 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'entry': entry, 'error': str(error)}) + '\n')
+        log.error('Dropping write after permanent error: %s', error, extra={'seq': entry['seq']})
+
+    def _commit_each(self, entries):
+        """Commit entries one at a time, setting aside the ones that can never succeed."""
+        for entry in entries:
+            try:
+                self.commit_fn([tuple(op) for op in entry['ops']])
+            except self.applied_errors:
+                log.info('Skipping write that was already committed', extra={'seq': entry['seq']})
+            except self.permanent_errors as e:
+                self._dead_letter(entry, e)
+            self._ack([entry])
+
+    def flush(self, timeout=-1):
+        """Commit one batch from the head of the queue; returns False if it failed.
+
+        Only one batch is ever in flight: a caller that finds another flush
+        running waits for it (up to `timeout` seconds) instead of committing
+        the same entries a second time.
+        """
+        if not self._flush_lock.acquire(timeout=timeout):
+            return False
+        try:
+            if self._journal.closed:
+                return False
+            return self._flush_batch()
+        finally:
+            if self._close_pending:
+                self._close_journal()
+            self._flush_lock.release()
+
+    def _close_journal(self):
+        with self._journal_lock:
+            self._journal.close()
+
+    def _flush_batch(self):
+        with self._cond:
+            entries = self._take_batch()
+        if not entries:
+            return True
+        try:
+            self.commit_fn([tuple(op) for entry in entries for op in entry['ops']])
+        except self.permanent_errors + self.applied_errors:
+            # Find the entries at fault by committing one at a time
+            try:
+                self._commit_each(entries)
+            except Exception:
+                log.exception('Error committing queued writes')
+                return False
+            return True
+        except Exception as e:
+            log.warning('Error committing queued writes, will retry: %s', e)
+            return False
+        self._ack(entries)
+        return True
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='write-behind-flusher', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout=5.0):
+        """Stop the flusher, committing what can be committed within `timeout` seconds.
+
+        Anything left over stays in the journal and is replayed on next start.
+        """
+        if self._stopped:
+            return
+        self._stopped = True
+        with self._cond:
+            self._stopping = True
+            self._stop_event.set()
+            self._cond.notify()
+        deadline = time.time() + timeout
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        # The flusher may still be committing a batch; flush() waits for it
+        # rather than committing the same entries again
+        while self._queue and time.time() < deadline:
+            if not self.flush(timeout=max(0, deadline - time.time())):
+                break
+        if self._queue:
+            log.warning('Writes left in the journal', extra={'writes': self._pending_ops, 'journal': self.journal_path})
+        # A batch still in flight is acknowledged before the journal closes:
+        # whichever of us holds the flush lock last closes it
+        self._close_pending = True
+        if self._flush_lock.acquire(timeout=max(0, deadline - time.time())):
+            try:
+                self._close_journal()
+            finally:
+                self._flush_lock.release()
+
+    def _run(self):
+        backoff = 0.5
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                # Give the batch a short window to fill up
+                deadline = time.time() + self.window
+                while (self._pending_ops < self.max_batch and not self._stopping
+                       and time.time() < deadline):
+                    self._cond.wait(deadline - time.time())
+                if self._stopping:
+                    return
+            if self.flush():
+                backoff = 0.5
+            else:
+                # Back off without being woken by new writes; only stop() cuts it short
+                if self._stop_event.wait(backoff):
+                    return
+                backoff = min(backoff * 2, self.max_backoff)